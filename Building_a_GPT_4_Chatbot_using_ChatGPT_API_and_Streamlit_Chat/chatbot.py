@@ -1,7 +1,11 @@
 import streamlit as st
 from streamlit_chat import message
-from utils import get_initial_message, get_chatgpt_response, update_chat
+from utils import get_initial_message, stream_chatgpt_response
+from memory import ConversationMemory
+from usage_store import UsageStore
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 load_dotenv()
 import openai
@@ -23,19 +27,57 @@ if 'past' not in st.session_state:
 
 query = st.text_input("Query: ", key = "input")
 
-if 'messages' not in st.session_state:
-    st.session_state['messages'] = get_initial_message()
+@st.cache_resource
+def get_usage_store(path):
+    return UsageStore(path)
+
+# Not USAGE_DB: the Swinburne bot's usage table has a different schema.
+usage_store = get_usage_store(os.getenv('TUTOR_USAGE_DB', 'tutor_usage.sqlite'))
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+
+if 'memory' not in st.session_state:
+    st.session_state['memory'] = ConversationMemory(get_initial_message(), max_tokens=2000)
+    st.session_state['messages'] = st.session_state['memory'].messages()
 
 if query:
+    memory = st.session_state['memory']
+    messages = memory.messages()
+    placeholder = st.empty()
+    usage = {}
+    parts = memory.prompt_parts(query)
+    start = time.perf_counter()
+
     with st.spinner("generating..."):
-        messages = st.session_state['messages']
+        stream = stream_chatgpt_response(messages + [{"role": "user", "content": query}], model, usage)
+        response = next(stream, "")
+    placeholder.markdown(response + "▌")
+    for token in stream:
+        response += token
+        placeholder.markdown(response + "▌")
+    placeholder.empty()
+    latency_ms = (time.perf_counter() - start) * 1000
+    # Without reported usage, fall back to the memory's own token estimates.
+    usage_store.record(session_id, model, usage.get('prompt_tokens', sum(parts.values())),
+                       usage.get('completion_tokens', memory.count(response)), parts,
+                       estimated=not usage, latency_ms=latency_ms)
 
-        messages = update_chat(messages, "user", query)
-        response = get_chatgpt_response(messages, model)
-        messages = update_chat(messages, "assistant", "response")
+    # Only a finished answer goes into the conversation; older turns are
+    # folded into a summary once the recent ones outgrow the token budget.
+    for role, content in (("user", query), ("assistant", response)):
+        memory.add(role, content)
+        if memory.summary_usage is not None:
+            usage_store.record(session_id, memory.model, memory.summary_usage.get('prompt_tokens', 0),
+                               memory.summary_usage.get('completion_tokens', 0), source='summary',
+                               estimated=not memory.summary_usage)
+    st.session_state['messages'] = memory.messages()
 
-        st.session_state.past.append(query)
-        st.session_state.generated.append(response)
+    st.session_state.past.append(query)
+    st.session_state.generated.append(response)
+    if usage:
+        st.caption(f"Tokens: {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion")
+    totals = usage_store.session_totals(session_id)
+    st.caption(f"This session: {totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens, "
+               f"${totals['cost']:.4f}")
 
 if st.session_state['generated']:
     for i in range(len(st.session_state['generated']) - 1, -1, -1):
@@ -0,0 +1,105 @@
+import tiktoken
+from utils import client, copy_usage
+
+# Role and separator tokens the chat format adds to every message.
+MESSAGE_OVERHEAD = 4
+
+def get_token_counter(model):
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # No tokenizer file available (e.g. offline): about four characters per token.
+        return lambda text: len(text) // 4 + 1
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+def summarize(summary, messages, model="gpt-3.5-turbo", usage=None):
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    response = client.chat.completions.create(
+        model = model,
+        messages = [
+            {
+                "role": "system",
+                "content": "Update the running summary of a tutoring conversation. "
+                           "Keep the topics covered, what the student knows and what they still want to learn. "
+                           "Reply with the new summary only, in under 150 words."
+            },
+            {
+                "role": "user",
+                "content": f"Current summary:\n{summary or '(none)'}\n\nNew conversation:\n{transcript}"
+            }
+        ]
+    )
+
+    if response.usage is not None and usage is not None:
+        copy_usage(usage, response.usage)
+    return response.choices[0].message.content
+
+class ConversationMemory:
+    """Messages to send to the model: the seed messages, a running summary
+    of older turns and the newest turns that fit in max_tokens.
+
+    Token counts are computed once, when a message is added. When the
+    recent turns overflow the budget, the oldest ones are folded into the
+    summary until they are back under fold_to of it, so the summary is
+    rewritten once every few turns rather than on every turn.
+    """
+
+    def __init__(self, seed_messages, max_tokens=2000, fold_to=0.6, model="gpt-3.5-turbo", summarizer=summarize):
+        self.seed_messages = seed_messages
+        self.max_tokens = max_tokens
+        self.fold_to = fold_to
+        self.model = model
+        self.summarizer = summarizer
+        self._count = get_token_counter(model)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turns = []
+        self.turn_tokens = []
+        # Token usage of the summary call made by the latest add(), if it folded.
+        self.summary_usage = None
+
+    def count(self, content):
+        return self._count(content) + MESSAGE_OVERHEAD
+
+    def add(self, role, content):
+        self.summary_usage = None
+        self.turns.append({"role": role, "content": content})
+        self.turn_tokens.append(self.count(content))
+        if self.summary_tokens + sum(self.turn_tokens) > self.max_tokens:
+            self._fold()
+
+    def _fold(self):
+        target = self.max_tokens * self.fold_to
+        folded = 0
+        total = self.summary_tokens + sum(self.turn_tokens)
+        # Fold whole user/assistant pairs, and always keep the latest pair.
+        while folded + 2 < len(self.turns) and total > target:
+            total -= self.turn_tokens[folded] + self.turn_tokens[folded + 1]
+            folded += 2
+        if not folded:
+            return
+        self.summary_usage = {}
+        self.summary = self.summarizer(self.summary, self.turns[:folded], self.model, self.summary_usage)
+        self.summary_tokens = self.count(self.summary)
+        self.turns = self.turns[folded:]
+        self.turn_tokens = self.turn_tokens[folded:]
+
+    def messages(self):
+        messages = list(self.seed_messages)
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        return messages + self.turns
+
+    def tokens(self):
+        seed_tokens = sum(self.count(message["content"]) for message in self.seed_messages)
+        return seed_tokens + self.summary_tokens + sum(self.turn_tokens)
+
+    def prompt_parts(self, query):
+        """Estimated prompt tokens of messages() plus query, by part: the seed
+        messages and summary count as system, recent turns as history."""
+        seed_tokens = sum(self.count(message["content"]) for message in self.seed_messages)
+        return {"system": seed_tokens + self.summary_tokens, "history": sum(self.turn_tokens),
+                "input": self.count(query)}
@@ -0,0 +1,65 @@
+import sqlite3
+import threading
+import time
+
+# USD per million (prompt, completion) tokens; dated model names match by prefix.
+PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+}
+
+PROMPT_PARTS = ('system', 'history', 'context', 'input')
+
+def cost(model, prompt_tokens, completion_tokens):
+    matches = [name for name in PRICES if (model or '').startswith(name)]
+    if not matches:
+        return None
+    rates = PRICES[max(matches, key=len)]
+    return (prompt_tokens * rates[0] + completion_tokens * rates[1]) / 1e6
+
+class UsageStore:
+    """SQLite log of the tokens and cost of every API call, one row per call.
+
+    Prompt tokens are also split by prompt part (system, history, context,
+    input); estimated = 1 marks calls whose usage was counted locally.
+    """
+
+    def __init__(self, path='tutor_usage.sqlite'):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "id INTEGER PRIMARY KEY, created_at REAL NOT NULL, session_id TEXT, source TEXT NOT NULL, "
+            "model TEXT, prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+            "system_tokens INTEGER, history_tokens INTEGER, context_tokens INTEGER, input_tokens INTEGER, "
+            "estimated INTEGER NOT NULL DEFAULT 0, latency_ms REAL, cost REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS usage_session ON usage (session_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS usage_created_at ON usage (created_at)")
+        self._conn.commit()
+
+    def record(self, session_id, model, prompt_tokens, completion_tokens, parts=None, source='chat',
+               estimated=False, latency_ms=None):
+        parts = parts or {}
+        call_cost = cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO usage (created_at, session_id, source, model, prompt_tokens, completion_tokens, "
+                "system_tokens, history_tokens, context_tokens, input_tokens, estimated, latency_ms, cost) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), session_id, source, model, prompt_tokens, completion_tokens,
+                 *(parts.get(part) for part in PROMPT_PARTS), int(estimated), latency_ms, call_cost)
+            )
+            self._conn.commit()
+        return call_cost
+
+    def session_totals(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0), "
+                "COALESCE(SUM(cost), 0) FROM usage WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return dict(zip(('calls', 'prompt_tokens', 'completion_tokens', 'cost'), row))
@@ -27,14 +27,36 @@ def get_initial_message():
 
     return messages
 
-def get_chatgpt_response(messages, model="gpt-3.5-turbo"):
+def copy_usage(usage, reported):
+    usage["prompt_tokens"] = reported.prompt_tokens
+    usage["completion_tokens"] = reported.completion_tokens
+    usage["total_tokens"] = reported.total_tokens
+
+def get_chatgpt_response(messages, model="gpt-3.5-turbo", usage=None):
     response = client.chat.completions.create(
         model = model,
         messages = messages
     )
 
+    if response.usage is not None and usage is not None:
+        copy_usage(usage, response.usage)
     return response.choices[0].message.content
 
+def stream_chatgpt_response(messages, model="gpt-3.5-turbo", usage=None):
+    stream = client.chat.completions.create(
+        model = model,
+        messages = messages,
+        stream = True,
+        stream_options = {"include_usage": True}
+    )
+
+    for chunk in stream:
+        # The final chunk carries no choices, only the token usage of the whole request.
+        if chunk.usage is not None and usage is not None:
+            copy_usage(usage, chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
 def update_chat(messages, role, content):
     messages.append(
         { 
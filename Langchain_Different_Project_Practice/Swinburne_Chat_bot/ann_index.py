@@ -0,0 +1,259 @@
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+ANN_FILE = "ann.faiss"
+ANN_CONFIG_FILE = "ann.json"
+ANN_VECTORS_FILE = "ann_vectors.f32"
+INDEX_TYPES = ('flat', 'ivf', 'hnsw')
+QUANTIZERS = ('fp16', 'int8', 'pq')
+
+def load_ann_config(folder_path):
+    path = os.path.join(folder_path, ANN_CONFIG_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+def default_nlist(count):
+    """About 4 * sqrt(n) lists, but never fewer than 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+class RerankedIndex:
+    """A quantized index whose candidates are re-scored exactly from float32
+    vectors memory-mapped from disk, so only the codes live in RAM.
+
+    Provides the part of the faiss index API the langchain FAISS store uses:
+    search, reconstruct, ntotal and d.
+    """
+
+    def __init__(self, index, vectors, rerank=4):
+        self.index = index
+        self.vectors = vectors
+        self.rerank = rerank
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def d(self):
+        return self.index.d
+
+    def search(self, queries, k):
+        _, candidates = self.index.search(queries, k * self.rerank)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, (query, rows) in enumerate(zip(queries, candidates)):
+            # Sorted rows read the float file front to back.
+            rows = np.sort(rows[rows != -1])
+            exact = ((self.vectors[rows] - query) ** 2).sum(axis=1)
+            top = np.argsort(exact)[:k]
+            distances[i, :len(top)] = exact[top]
+            labels[i, :len(top)] = rows[top]
+        return distances, labels
+
+    def reconstruct(self, i):
+        return np.array(self.vectors[i])
+
+def open_vectors(folder_path, dim):
+    return np.memmap(os.path.join(folder_path, ANN_VECTORS_FILE), dtype=np.float32, mode='r').reshape(-1, dim)
+
+def factory_string(index_type, quantize, dim, count, nlist, m, pq_m):
+    """The faiss.index_factory description for an index type and code format."""
+    if quantize == 'pq':
+        # Each sub-quantizer's 2**nbits centroids want 39 training vectors apiece;
+        # small corpora get fewer bits rather than a degenerate k-means.
+        nbits = max(1, min(8, int(math.log2(max(count // 39, 2)))))
+        codes = f"PQ{pq_m}x{nbits}"
+    else:
+        codes = {None: "Flat", 'fp16': "SQfp16", 'int8': "SQ8"}[quantize]
+    if index_type == 'ivf':
+        return f"IVF{nlist},{codes}"
+    if index_type == 'hnsw':
+        return f"HNSW{m},{codes}"
+    return codes
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    faiss = dependable_faiss_import()
+    if isinstance(index, RerankedIndex):
+        index = index.index
+    params = faiss.ParameterSpace()
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, 'nprobe', nprobe)
+    if ef_search is not None and hasattr(index, 'hnsw'):
+        params.set_index_parameter(index, 'efSearch', ef_search)
+
+def ann_recall(flat_index, ann_index, queries, k=10):
+    """Fraction of the flat index's top k that ann_index also returns, and ms per query for each."""
+    start = time.perf_counter()
+    _, truth = flat_index.search(queries, k)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    start = time.perf_counter()
+    _, found = ann_index.search(queries, k)
+    ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    hits = sum(len(set(t[t != -1]) & set(f[f != -1])) for t, f in zip(truth, found))
+    total = sum(int((t != -1).sum()) for t in truth)
+    return hits / total if total else 1.0, flat_ms, ann_ms
+
+def sample_rows(count, size, seed=0):
+    return np.sort(np.random.default_rng(seed).choice(count, min(size, count), replace=False))
+
+def sample_queries(vectors, size, seed=1):
+    """Stored vectors plus a little noise, so no query sits exactly on its own nearest neighbour."""
+    rng = np.random.default_rng(seed)
+    queries = vectors[sample_rows(len(vectors), size, seed)]
+    noise = rng.standard_normal(queries.shape).astype(np.float32) * vectors.std(axis=0) * 0.1
+    return queries + noise
+
+def tune(flat_index, index, queries, k, name, candidates, target_recall):
+    """Smallest candidate value of search parameter name whose recall@k reaches target_recall."""
+    for value in candidates:
+        set_search_params(index, **{name: value})
+        recall, _, _ = ann_recall(flat_index, index, queries, k)
+        if recall >= target_recall:
+            break
+    return value
+
+def remove_ann_index(folder_path):
+    for name in (ANN_FILE, ANN_CONFIG_FILE, ANN_VECTORS_FILE):
+        if os.path.exists(os.path.join(folder_path, name)):
+            os.remove(os.path.join(folder_path, name))
+
+def build_ann_index(vector_store, folder_path, index_type='flat', quantize=None, nlist=None,
+                    train_size=None, m=32, ef_construction=80, pq_m=None, rerank=None,
+                    nprobe=None, ef_search=None, recall_k=10, target_recall=0.95):
+    """Build an IVF or HNSW and/or quantized copy of vector_store's flat index into folder_path.
+
+    The flat index.faiss stays the source of truth for updates, deletes and
+    shard merges; ann.faiss is rebuilt from it on every save, and ann.json
+    records how, along with the default nprobe / efSearch VectorDB uses.
+    Unless given, those defaults are the smallest that reach target_recall
+    against the flat index on a sample of stored vectors.
+
+    With quantize ('fp16', 'int8' or 'pq') ann.faiss holds compressed codes
+    and the float32 vectors are written to ann_vectors.f32; searches fetch
+    rerank * k candidates from the codes and re-score them from that file.
+    Unless given, rerank starts at 4 and doubles (up to 64) until the
+    tuned index reaches target_recall.
+    A plain flat index removes any ANN index left by an earlier build.
+    """
+    if index_type == 'flat' and not quantize:
+        remove_ann_index(folder_path)
+        return None
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+    if quantize not in (None,) + QUANTIZERS:
+        raise ValueError(f"unknown quantizer {quantize!r}; expected one of {QUANTIZERS}")
+
+    faiss = dependable_faiss_import()
+    start = time.perf_counter()
+    flat_index = vector_store.index
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    count, dim = vectors.shape
+    k = min(recall_k, count)
+    queries = sample_queries(vectors, 200)
+    nlist = nlist or default_nlist(count)
+    # One byte per four dimensions, 16x smaller than float32; m must divide dim.
+    pq_m = pq_m or max(n for n in range(1, max(dim // 4, 1) + 1) if dim % n == 0)
+    description = factory_string(index_type, quantize, dim, count, nlist, m, pq_m)
+    config = {'type': index_type, 'quantize': quantize, 'factory': description}
+
+    index = faiss.index_factory(dim, description)
+    if hasattr(index, 'hnsw'):
+        index.hnsw.efConstruction = ef_construction
+    if not index.is_trained:
+        default_size = 64 * nlist if index_type == 'ivf' else 0
+        if quantize == 'pq':
+            default_size = max(default_size, 256 * 39)
+        train = vectors[sample_rows(count, train_size or max(default_size, 1000))]
+        index.train(train)
+        config['train_size'] = len(train)
+    index.add(vectors)
+
+    searcher = index
+    if quantize:
+        path = os.path.join(folder_path, ANN_VECTORS_FILE)
+        vectors.astype(np.float32).tofile(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        searcher = RerankedIndex(index, open_vectors(folder_path, dim), rerank or 4)
+    elif index_type == 'ivf':
+        # Lets max_marginal_relevance_search reconstruct vectors by id.
+        index.make_direct_map()
+    if not quantize and os.path.exists(os.path.join(folder_path, ANN_VECTORS_FILE)):
+        os.remove(os.path.join(folder_path, ANN_VECTORS_FILE))
+
+    if index_type == 'ivf':
+        candidates = [n for n in (1, 2, 4, 8, 16, 32, 64, 128, 256, 512) if n < nlist] + [nlist]
+        nprobe = nprobe or tune(flat_index, searcher, queries, k, 'nprobe', candidates, target_recall)
+        config.update(nlist=nlist, nprobe=nprobe)
+    elif index_type == 'hnsw':
+        ef_search = ef_search or tune(flat_index, searcher, queries, k, 'ef_search',
+                                      (16, 32, 64, 128, 256, 512), target_recall)
+        config.update(m=m, ef_construction=ef_construction, ef_search=ef_search)
+    set_search_params(searcher, config.get('nprobe'), config.get('ef_search'))
+    if quantize:
+        while (rerank is None and searcher.rerank < 64
+               and ann_recall(flat_index, searcher, queries, k)[0] < target_recall):
+            searcher.rerank *= 2
+        config['rerank'] = searcher.rerank
+    build_seconds = time.perf_counter() - start
+
+    recall, flat_ms, ann_ms = ann_recall(flat_index, searcher, queries, k)
+    config.update(recall_at_k=round(recall, 4), k=k)
+
+    path = os.path.join(folder_path, ANN_FILE)
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    with open(os.path.join(folder_path, ANN_CONFIG_FILE), 'w') as file:
+        json.dump(config, file, indent=2)
+    print(f"ANN index: {config} built in {build_seconds:.1f}s; "
+          f"{ann_ms:.3f} ms/query vs {flat_ms:.3f} ms flat; "
+          f"{os.path.getsize(path) / 1024 ** 2:.1f} MiB in memory vs {vectors.nbytes / 1024 ** 2:.1f} MiB flat")
+    return searcher
+
+def load_ann_index(folder_path, nprobe=None, ef_search=None, rerank=None, mmap=False):
+    """Read ann.faiss with the recorded search parameters, overridden by any given here.
+
+    A quantized index comes back wrapped in a RerankedIndex over ann_vectors.f32.
+    """
+    faiss = dependable_faiss_import()
+    config = load_ann_config(folder_path) or {}
+    flags = (faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY) if mmap else 0
+    index = faiss.read_index(os.path.join(folder_path, ANN_FILE), flags)
+    if config.get('quantize'):
+        index = RerankedIndex(index, open_vectors(folder_path, index.d), rerank or config['rerank'])
+    set_search_params(index, nprobe or config.get('nprobe'), ef_search or config.get('ef_search'))
+    return index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep nprobe / efSearch / rerank of a saved ANN index against the flat one.")
+    parser.add_argument('index', nargs='?', default='Swinburne_Chat_Bot')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    faiss = dependable_faiss_import()
+    flat_index = faiss.read_index(os.path.join(args.index, "index.faiss"))
+    ann_index = load_ann_index(args.index)
+    queries = sample_queries(flat_index.reconstruct_n(0, flat_index.ntotal), args.queries)
+    codes = ann_index.index if isinstance(ann_index, RerankedIndex) else ann_index
+    ivf = faiss.try_extract_index_ivf(codes)
+    if ivf is not None:
+        name, values = 'nprobe', [n for n in (1, 2, 4, 8, 16, 32, 64, 128) if n <= ivf.nlist]
+    elif hasattr(codes, 'hnsw'):
+        name, values = 'efSearch', [16, 32, 64, 128, 256]
+    else:
+        name, values = 'rerank', [1, 2, 4, 8, 16]
+    for value in values:
+        if name == 'rerank':
+            ann_index.rerank = value
+        else:
+            set_search_params(ann_index, **({'nprobe': value} if name == 'nprobe' else {'ef_search': value}))
+        recall, flat_ms, ann_ms = ann_recall(flat_index, ann_index, queries, args.k)
+        print(f"{name}={value}: recall@{args.k} {recall:.3f}, {ann_ms:.3f} ms/query (flat {flat_ms:.3f} ms)")
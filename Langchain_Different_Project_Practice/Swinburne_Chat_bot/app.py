@@ -1,4 +1,9 @@
+import asyncio
 import os
+import pickle
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 import streamlit as st
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
@@ -6,17 +11,67 @@ from langchain_community.vectorstores.faiss import FAISS
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains.retrieval import create_retrieval_chain
+from langchain.retrievers import ContextualCompressionRetriever
 from langchain_core.messages import HumanMessage, AIMessage
+from ann_index import ANN_FILE, load_ann_index
+from chat_history import HistoryWindow
+from context_compressor import compressor_from_env
+from embedding_cache import CachedQueryEmbeddings, EmbeddingCache, embedder_name
+from hybrid_retriever import HybridRetriever
+from lexical_index import LexicalIndex, has_lexical_index
+from mmap_store import is_mmap_store, load_mmap_store
+from semantic_cache import SemanticCache
+from tracing import TracedIndex, TracingCallbackHandler, configure_tracing_from_env, span, tracing_enabled
+from usage_store import UsageCallbackHandler, UsageStore
 
 load_dotenv()
+configure_tracing_from_env()
 
 class VectorDB:
-    def __init__(self, vector_path):
+    def __init__(self, vector_path, embedder=None, query_cache_size=1024, query_cache_path=None,
+                 retriever_mode=None, index_type=None, nprobe=None, ef_search=None, rerank=None):
         self.vector_path = vector_path
-        self.vector_store = self._load_vector_store()
+        # 'auto' searches the IVF/HNSW/quantized index when one was built, 'flat' always searches exhaustively.
+        self.index_type = index_type or os.getenv('VECTOR_INDEX', 'auto')
+        self.nprobe = nprobe or int(os.getenv('FAISS_NPROBE', '0')) or None
+        self.ef_search = ef_search or int(os.getenv('FAISS_EF_SEARCH', '0')) or None
+        # Candidates per result re-scored from ann_vectors.f32 when the index holds quantized codes.
+        self.rerank = rerank or int(os.getenv('FAISS_RERANK', '0')) or None
+        # 'mmr' (dense only) or 'hybrid' (dense + BM25, fused by reciprocal rank).
+        self.retriever_mode = retriever_mode or os.getenv('RETRIEVER_MODE', 'mmr')
+        embedder = embedder or OpenAIEmbeddings()
+        disk_cache = None
+        if query_cache_path:
+            disk_cache = EmbeddingCache(query_cache_path, embedder_name(embedder))
+        self.embedder = CachedQueryEmbeddings(embedder, max_entries=query_cache_size, disk_cache=disk_cache)
+        with span('vectordb.load', path=vector_path) as load_span:
+            self.vector_store = self._load_vector_store()
+            load_span.set(index=type(self.vector_store.index).__name__, vectors=self.vector_store.index.ntotal)
+        # Times every FAISS search while tracing is on; a no-op check otherwise.
+        self.vector_store.index = TracedIndex(self.vector_store.index)
+        self.lexical_index = None
+        if self.retriever_mode == 'hybrid':
+            if has_lexical_index(vector_path):
+                self.lexical_index = LexicalIndex(vector_path)
+            else:
+                print(f"{vector_path} has no lexical index; falling back to mmr retrieval")
+                self.retriever_mode = 'mmr'
 
     def _load_vector_store(self):
-        embedder = OpenAIEmbeddings()
+        embedder = self.embedder
+        use_ann = self.index_type != 'flat' and os.path.exists(os.path.join(self.vector_path, ANN_FILE))
+        if is_mmap_store(self.vector_path):
+            vector_store = load_mmap_store(self.vector_path, embedder)
+            if use_ann:
+                vector_store.index = load_ann_index(self.vector_path, self.nprobe, self.ef_search,
+                                                    self.rerank, mmap=True)
+            return vector_store
+        if use_ann:
+            # Skip reading the flat index.faiss into memory just to replace it.
+            with open(os.path.join(self.vector_path, "index.pkl"), "rb") as file:
+                docstore, index_to_docstore_id = pickle.load(file)
+            index = load_ann_index(self.vector_path, self.nprobe, self.ef_search, self.rerank)
+            return FAISS(embedder, index, docstore, index_to_docstore_id)
         return FAISS.load_local(
             self.vector_path,
             embedder,
@@ -24,11 +79,21 @@ class VectorDB:
             allow_dangerous_deserialization=True
         )
 
-    def get_retriever(self):
-        return self.vector_store.as_retriever(
-            search_type="mmr",
-            search_kwargs={'k': 1, "score_threshold": 0.1}
-        )
+    def get_retriever(self, k=1, search_type=None, fetch_k=20, score_threshold=0.1):
+        """search_type is 'hybrid' or a FAISS one ('mmr', 'similarity', 'similarity_score_threshold');
+        it defaults to the retriever mode."""
+        search_type = search_type or self.retriever_mode
+        if search_type == 'hybrid':
+            return HybridRetriever(vector_store=self.vector_store, lexical_index=self.lexical_index,
+                                   k=k, fetch_k=fetch_k)
+        # FAISS passes leftover search kwargs down to the search, where score_threshold on
+        # 'similarity' is a maximum L2 distance; only give each type the settings it uses.
+        search_kwargs = {'k': k}
+        if search_type == 'mmr':
+            search_kwargs['fetch_k'] = fetch_k
+        elif search_type == 'similarity_score_threshold':
+            search_kwargs['score_threshold'] = score_threshold
+        return self.vector_store.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
 
     def similarity_search(self, query):
         return self.vector_store.similarity_search_with_score(
@@ -37,16 +102,108 @@ class VectorDB:
             k=1
         )[0][1]
 
+class VectorDBHolder:
+    def __init__(self, vector_path, embedder=None):
+        self.vector_path = vector_path
+        self.embedder = embedder
+        self._lock = threading.Lock()
+        self._vector_db = None
+        self._signature = None
+        self.version = 0
+        # Called with no arguments after every successful (re)load.
+        self.on_reload = []
+
+    def _read_signature(self):
+        signature = []
+        for name in sorted(os.listdir(self.vector_path)):
+            stat = os.stat(os.path.join(self.vector_path, name))
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def get(self):
+        signature = self._read_signature()
+        if self._vector_db is None or signature != self._signature:
+            self._load(signature)
+        return self._vector_db
+
+    def reload(self):
+        self._load(self._read_signature(), force=True)
+        return self._vector_db
+
+    def _load(self, signature, force=False):
+        with self._lock:
+            if not force and self._vector_db is not None and signature == self._signature:
+                return
+            try:
+                self._vector_db = VectorDB(self.vector_path, embedder=self.embedder,
+                                           query_cache_path=os.getenv('QUERY_EMBEDDING_CACHE'))
+                self._signature = signature
+                self.version += 1
+                for callback in self.on_reload:
+                    callback()
+            except Exception as e:
+                # A rebuild may still be writing the directory; keep serving the old index.
+                if self._vector_db is None:
+                    raise
+                print(f"Error reloading {self.vector_path}: {e}")
+
+@st.cache_resource
+def get_vector_db_holder(vector_path):
+    return VectorDBHolder(vector_path)
+
+@st.cache_resource
+def get_answer_cache(vector_path):
+    holder = get_vector_db_holder(vector_path)
+    answer_cache = SemanticCache(
+        holder.get().embedder,
+        threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95')),
+        ttl=float(os.getenv('SEMANTIC_CACHE_TTL', str(24 * 3600)))
+    )
+    holder.on_reload.append(answer_cache.invalidate)
+    return answer_cache
+
+@st.cache_resource
+def get_usage_store(path):
+    return UsageStore(path)
+
+@st.cache_resource(max_entries=1)
+def get_chatbot(vector_path, index_version, usage_path):
+    """One ChatBot (and token-count cache) per loaded index version, shared across reruns and sessions."""
+    holder = get_vector_db_holder(vector_path)
+    return ChatBot(holder.get(), answer_cache=get_answer_cache(vector_path),
+                   usage_store=get_usage_store(usage_path))
+
+def is_standalone(chat_history):
+    """True until the bot has answered; later questions may lean on earlier turns, so aren't cached."""
+    return not any(isinstance(msg, AIMessage) for msg in chat_history)
+
 class ChatBot:
-    def __init__(self, vector_db):
+    def __init__(self, vector_db, llm=None, answer_cache=None, history_window=None, usage_store=None,
+                 compressor=None):
         self.vector_db = vector_db
+        # stream_usage makes streamed replies end with their token usage too.
+        self.llm = llm or ChatOpenAI(model="gpt-4o", temperature=0.5, stream_usage=True)
+        self.answer_cache = answer_cache
+        self.usage_store = usage_store
+        self.history_window = history_window or HistoryWindow()
+        # Trims retrieved chunks to their sentences relevant to the query before they reach {context}.
+        self.compressor = compressor or compressor_from_env(vector_db.embedder, vector_db.vector_path)
+        if self.compressor is not None:
+            # Compressed context never outgrows its budget, so history can have the rest.
+            self.history_window.context_tokens = min(self.history_window.context_tokens,
+                                                     self.compressor.max_tokens)
+        self.history_window.set_fixed_prompt(
+            self._create_prompt().format_messages(context="", chat_history=[], input="")
+        )
         self.chain = self._create_chain()
 
     def _create_chain(self):
-        model = ChatOpenAI(model="gpt-4o", temperature=0.5)
+        model = self.llm
         prompt = self._create_prompt()
         document_chain = create_stuff_documents_chain(prompt=prompt, llm=model)
         retriever = self.vector_db.get_retriever()
+        if self.compressor is not None:
+            retriever = ContextualCompressionRetriever(base_compressor=self.compressor, base_retriever=retriever)
         return create_retrieval_chain(retriever, document_chain)
 
     def _create_prompt(self):
@@ -72,23 +229,178 @@ class ChatBot:
             ('human', '{input}')
         ])
 
-    def process_chat(self, query, chat_history):
-        response = self.chain.invoke({
-            'input': query,
-            'chat_history': chat_history
-        })
-        return response['answer']
+    def _cached_answer(self, query, chat_history):
+        """Return (answer or None, query vector or None if the query can't be cached)."""
+        if self.answer_cache is None or not is_standalone(chat_history):
+            return None, None
+        with span('answer_cache') as cache_span:
+            vector = self.answer_cache.embed(query)
+            answer = self.answer_cache.lookup(vector)
+            cache_span.set(hit=answer is not None)
+        return answer, vector
+
+    async def _acached_answer(self, query, chat_history):
+        if self.answer_cache is None or not is_standalone(chat_history):
+            return None, None
+        with span('answer_cache') as cache_span:
+            vector = await self.answer_cache.aembed(query)
+            answer = self.answer_cache.lookup(vector)
+            cache_span.set(hit=answer is not None)
+        return answer, vector
+
+    def _chain_input(self, query, chat_history):
+        # chat_history holds the earlier turns only; the query itself goes in as {input}.
+        with span('prompt.history', messages=len(chat_history)) as history_span:
+            window, history_tokens = self.history_window.select(chat_history, query)
+            history_span.set(kept=len(window), tokens=history_tokens)
+        return {'input': query, 'chat_history': window}, history_tokens
+
+    @staticmethod
+    def _chain_config(usage):
+        callbacks = [usage]
+        if tracing_enabled():
+            callbacks.append(TracingCallbackHandler())
+        return {'callbacks': callbacks}
+
+    def _report_prompt_tokens(self, query, history_tokens, docs, chat_span):
+        prompt_tokens = {
+            'fixed': self.history_window.fixed_tokens,
+            'history': history_tokens,
+            'context': sum(self.history_window.count_text(doc.page_content) for doc in docs),
+            'input': self.history_window.count_text(query),
+        }
+        prompt_tokens['total'] = sum(prompt_tokens.values())
+        chat_span.set(documents=len(docs), prompt_tokens=prompt_tokens['total'])
+        return prompt_tokens
+
+    def _record_usage(self, session_id, usage, prompt_tokens, answer, start):
+        """Return the token usage the model reported for this request, or the local
+        estimate when the response carried none, and log it to the usage store.
+
+        The ChatBot is shared across sessions, so usage is returned, never kept on it.
+        """
+        estimated = not usage.reported
+        result = {
+            'model': usage.model or getattr(self.llm, 'model_name', None),
+            'prompt_tokens': prompt_tokens['total'] if estimated else usage.prompt_tokens,
+            'completion_tokens': self.history_window.count_text(answer) if estimated else usage.completion_tokens,
+            'estimated': estimated,
+            'parts': {'system': prompt_tokens['fixed'], 'history': prompt_tokens['history'],
+                      'context': prompt_tokens['context'], 'input': prompt_tokens['input']},
+        }
+        if self.usage_store is not None:
+            result['cost'] = self.usage_store.record(
+                session_id, result['model'], result['prompt_tokens'],
+                result['completion_tokens'], result['parts'], estimated=estimated,
+                latency_ms=(time.perf_counter() - start) * 1000
+            )
+        return result
+
+    def _record_cached(self, session_id):
+        if self.usage_store is not None:
+            self.usage_store.record(session_id, None, 0, 0, cached=True)
+        return {'model': None, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached': True}
+
+    def process_chat(self, query, chat_history, session_id=None):
+        """Return (answer, usage) for query; usage is this request's token counts and cost."""
+        with span('chat', streamed=False) as chat_span:
+            answer, vector = self._cached_answer(query, chat_history)
+            chat_span.set(cached=answer is not None)
+            if answer is not None:
+                return answer, self._record_cached(session_id)
+            start = time.perf_counter()
+            inputs, history_tokens = self._chain_input(query, chat_history)
+            usage = UsageCallbackHandler()
+            response = self.chain.invoke(inputs, config=self._chain_config(usage))
+            prompt_tokens = self._report_prompt_tokens(query, history_tokens, response.get('context', []), chat_span)
+            result = self._record_usage(session_id, usage, prompt_tokens, response['answer'], start)
+            if vector is not None:
+                self.answer_cache.store(vector, query, response['answer'])
+            return response['answer'], result
+
+    def stream_chat(self, query, chat_history, session_id=None):
+        with span('chat', streamed=True) as chat_span:
+            answer, vector = self._cached_answer(query, chat_history)
+            chat_span.set(cached=answer is not None)
+            if answer is not None:
+                self._record_cached(session_id)
+                yield answer
+                return
+            start = time.perf_counter()
+            inputs, history_tokens = self._chain_input(query, chat_history)
+            usage = UsageCallbackHandler()
+            tokens = []
+            docs = []
+            for chunk in self.chain.stream(inputs, config=self._chain_config(usage)):
+                if 'context' in chunk:
+                    docs = chunk['context']
+                if chunk.get('answer'):
+                    tokens.append(chunk['answer'])
+                    yield chunk['answer']
+            prompt_tokens = self._report_prompt_tokens(query, history_tokens, docs, chat_span)
+            self._record_usage(session_id, usage, prompt_tokens, "".join(tokens), start)
+            if vector is not None:
+                self.answer_cache.store(vector, query, "".join(tokens))
+
+    async def aprocess_chat(self, query, chat_history, session_id=None):
+        """Async process_chat; the usage store's SQLite writes run in a worker thread."""
+        with span('chat', streamed=False) as chat_span:
+            answer, vector = await self._acached_answer(query, chat_history)
+            chat_span.set(cached=answer is not None)
+            if answer is not None:
+                return answer, await asyncio.to_thread(self._record_cached, session_id)
+            start = time.perf_counter()
+            inputs, history_tokens = self._chain_input(query, chat_history)
+            usage = UsageCallbackHandler()
+            response = await self.chain.ainvoke(inputs, config=self._chain_config(usage))
+            prompt_tokens = self._report_prompt_tokens(query, history_tokens, response.get('context', []), chat_span)
+            result = await asyncio.to_thread(self._record_usage, session_id, usage, prompt_tokens,
+                                             response['answer'], start)
+            if vector is not None:
+                self.answer_cache.store(vector, query, response['answer'])
+            return response['answer'], result
+
+    async def astream_chat(self, query, chat_history, session_id=None):
+        with span('chat', streamed=True) as chat_span:
+            answer, vector = await self._acached_answer(query, chat_history)
+            chat_span.set(cached=answer is not None)
+            if answer is not None:
+                await asyncio.to_thread(self._record_cached, session_id)
+                yield answer
+                return
+            start = time.perf_counter()
+            inputs, history_tokens = self._chain_input(query, chat_history)
+            usage = UsageCallbackHandler()
+            tokens = []
+            docs = []
+            async for chunk in self.chain.astream(inputs, config=self._chain_config(usage)):
+                if 'context' in chunk:
+                    docs = chunk['context']
+                if chunk.get('answer'):
+                    tokens.append(chunk['answer'])
+                    yield chunk['answer']
+            prompt_tokens = self._report_prompt_tokens(query, history_tokens, docs, chat_span)
+            await asyncio.to_thread(self._record_usage, session_id, usage, prompt_tokens, "".join(tokens), start)
+            if vector is not None:
+                self.answer_cache.store(vector, query, "".join(tokens))
 
 class ChatInterface:
     def __init__(self, chatbot):
         self.chatbot = chatbot
-        self.chat_history = []
+        # Kept in session state so the conversation survives Streamlit reruns.
+        self.chat_history = st.session_state.setdefault('chat_history', [])
+        self.session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
 
-    def setup_page(self):
+    @staticmethod
+    def setup_page():
         st.set_page_config(page_title="Chat With Swinburne FAQ", page_icon="🎓")
         st.header("Chat With Swinburne FAQ 🎓")
 
     def display_chat_history(self):
+        with span('streamlit.history', messages=len(self.chat_history)):
+            self._render_history()
+
+    def _render_history(self):
         for msg in reversed(self.chat_history):
             if isinstance(msg, HumanMessage):
                 st.chat_message("user", avatar="🧑").markdown(f"**You:** {msg.content}")
@@ -102,21 +414,61 @@ class ChatInterface:
         return user_input if submit_button else None
 
     def process_user_input(self, user_input):
-        with st.spinner('FAQ Chatbot is thinking...'):
-            self.chat_history.append(HumanMessage(content=user_input))
-            ai_output = self.chatbot.process_chat(user_input, self.chat_history)
-            self.chat_history.append(AIMessage(content=ai_output))
+        # A copy of the earlier turns, taken before the question joins them.
+        stream = self.chatbot.stream_chat(user_input, list(self.chat_history), self.session_id)
+        self.chat_history.append(HumanMessage(content=user_input))
+        with span('streamlit.turn') as turn_span:
+            bubble = st.empty()
+            with st.spinner('FAQ Chatbot is thinking...'):
+                ai_output = next(stream, "")
+            # Time spent redrawing the bubble, as opposed to waiting on the stream.
+            render_seconds = 0.0
+            start = time.perf_counter()
+            bubble.chat_message("assistant", avatar="🤖").markdown(f"**FAQ:** {ai_output}▌")
+            render_seconds += time.perf_counter() - start
+            for token in stream:
+                ai_output += token
+                start = time.perf_counter()
+                bubble.chat_message("assistant", avatar="🤖").markdown(f"**FAQ:** {ai_output}▌")
+                render_seconds += time.perf_counter() - start
+            # display_chat_history renders the finished answer with the rest of the conversation.
+            bubble.empty()
+            turn_span.set(render_ms=round(render_seconds * 1000, 1))
+        self.chat_history.append(AIMessage(content=ai_output))
+
+    def show_cache_stats(self):
+        if self.chatbot.answer_cache is None:
+            return
+        stats = self.chatbot.answer_cache.stats()
+        st.sidebar.caption(
+            f"Answer cache: {stats['hits']}/{stats['lookups']} hits ({stats['hit_rate']:.0%}), "
+            f"{stats['llm_calls_saved']} LLM calls saved"
+        )
+
+    def show_usage(self):
+        if self.chatbot.usage_store is None:
+            return
+        totals = self.chatbot.usage_store.session_totals(self.session_id)
+        st.sidebar.caption(
+            f"This session: {totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens, "
+            f"${totals['cost']:.4f}"
+        )
 
     def run(self):
-        self.setup_page()
         user_input = self.get_user_input()
         if user_input:
             self.process_user_input(user_input)
         self.display_chat_history()
+        self.show_cache_stats()
+        self.show_usage()
 
 def main():
-    vector_db = VectorDB(vector_path='Swinburne_Chat_Bot')
-    chatbot = ChatBot(vector_db)
+    # set_page_config must come before anything else, including the cached loaders' spinners.
+    ChatInterface.setup_page()
+    holder = get_vector_db_holder('Swinburne_Chat_Bot')
+    # Picks up a rebuilt index; the ChatBot is only rebuilt when the version changes.
+    holder.get()
+    chatbot = get_chatbot('Swinburne_Chat_Bot', holder.version, os.getenv('USAGE_DB', 'usage.sqlite'))
     interface = ChatInterface(chatbot)
     interface.run()
 
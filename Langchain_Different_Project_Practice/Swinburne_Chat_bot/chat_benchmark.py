@@ -0,0 +1,129 @@
+import argparse
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_openai import ChatOpenAI
+
+from app import ChatBot, VectorDB
+from create_vector_store import get_embedder
+
+DEFAULT_CORPUS = [
+    ["When is the census date for semester 1?", "What happens if I withdraw after it?"],
+    ["How do I apply for special consideration?", "How long does a decision take?", "Can I appeal it?"],
+    ["Where is the Hawthorn library?", "What are its opening hours during exams?"],
+    ["How much are international student fees for a Bachelor of Computer Science?"],
+    ["Is there on-campus accommodation?", "How do I apply?", "Is parking included?"],
+    ["Who do I contact about a disability adjustment?"],
+    ["How do I enrol in COS10009?", "What are the prerequisites?"],
+    ["What support is there for mental health?", "Is it free for students?"],
+]
+
+# The measurement dict of the turn running in this context; langchain copies
+# contexts into the threads it runs chain steps on.
+_current_turn = contextvars.ContextVar('current_turn', default=None)
+
+class FirstTokenTimer(BaseCallbackHandler):
+    def on_llm_new_token(self, token, **kwargs):
+        turn = _current_turn.get()
+        if turn is not None and 'first_token' not in turn and token:
+            turn['first_token'] = time.perf_counter()
+
+def load_corpus(path):
+    """JSONL, one conversation per line: a list of user turns or {"turns": [...]}."""
+    corpus = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                conversation = json.loads(line)
+                corpus.append(conversation['turns'] if isinstance(conversation, dict) else conversation)
+    return corpus
+
+def replay(chatbot, conversation, turns, lock):
+    """Play one conversation turn by turn, appending a measurement per turn to turns."""
+    chat_history = []
+    for query in conversation:
+        turn = {}
+        _current_turn.set(turn)
+        start = time.perf_counter()
+        try:
+            answer, _ = chatbot.process_chat(query, chat_history)
+        except Exception as e:
+            with lock:
+                turns.append({'error': f"{type(e).__name__}: {e}"})
+            return
+        end = time.perf_counter()
+        chat_history.extend([HumanMessage(content=query), AIMessage(content=answer)])
+        with lock:
+            turns.append({
+                'latency': end - start,
+                # Answers served from a cache never reach the model.
+                'ttft': turn.get('first_token', end) - start,
+                'tokens': len(answer.split()),
+            })
+
+def run_level(chatbot, corpus, concurrency):
+    turns = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(replay, chatbot, conversation, turns, lock) for conversation in corpus]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    ok = [turn for turn in turns if 'error' not in turn]
+    result = {'concurrency': concurrency, 'turns': len(ok), 'errors': len(turns) - len(ok),
+              'elapsed_s': elapsed, 'turns_per_s': len(ok) / elapsed,
+              'tokens_per_s': sum(turn['tokens'] for turn in ok) / elapsed}
+    for name in ('ttft', 'latency'):
+        values = [turn[name] * 1000 for turn in ok] or [0.0]
+        for p in (50, 95, 99):
+            result[f"{name}_p{p}_ms"] = float(np.percentile(values, p))
+    return result
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Replay conversations through ChatBot.process_chat at several concurrency levels. "
+                    "Run fake_openai_server.py and set OPENAI_BASE_URL to benchmark without API quota.")
+    parser.add_argument('--index', default='Swinburne_Chat_Bot')
+    parser.add_argument('--corpus', help="JSONL of conversations (default: a built-in set of student questions)")
+    parser.add_argument('--repeat', type=int, default=1, help="replay the corpus this many times per level")
+    parser.add_argument('--concurrency', default='1,4,16', help="comma-separated concurrent conversations")
+    parser.add_argument('--model', default='gpt-4o')
+    parser.add_argument('--fake-embeddings', type=int, metavar='DIM',
+                        help="embed queries locally instead of through the embeddings endpoint")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    corpus = (load_corpus(args.corpus) if args.corpus else DEFAULT_CORPUS) * args.repeat
+    vector_db = VectorDB(args.index, embedder=get_embedder(args.fake_embeddings))
+    # Streaming lets the timer see the first token even though process_chat returns whole answers.
+    llm = ChatOpenAI(model=args.model, temperature=0.5, streaming=True, callbacks=[FirstTokenTimer()])
+    # No answer cache: every turn should reach the model.
+    chatbot = ChatBot(vector_db, llm=llm)
+
+    results = []
+    for concurrency in (int(level) for level in args.concurrency.split(',')):
+        result = run_level(chatbot, corpus, concurrency)
+        results.append(result)
+        print(f"concurrency {concurrency:>3}: {result['turns']} turns, {result['errors']} errors, "
+              f"{result['turns_per_s']:.2f} turns/s, {result['tokens_per_s']:.0f} tokens/s | "
+              f"TTFT p50 {result['ttft_p50_ms']:.0f} p95 {result['ttft_p95_ms']:.0f} ms | "
+              f"latency p50 {result['latency_p50_ms']:.0f} p95 {result['latency_p95_ms']:.0f} "
+              f"p99 {result['latency_p99_ms']:.0f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'created_at': time.time(), 'model': args.model, 'index': args.index,
+                       'conversations': len(corpus), 'results': results}, file, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
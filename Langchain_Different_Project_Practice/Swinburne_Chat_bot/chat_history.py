@@ -0,0 +1,53 @@
+from functools import lru_cache
+
+from langchain_core.messages import HumanMessage
+from embedding_batcher import get_token_counter
+
+# Chat formats add a few tokens per message for the role and separators.
+MESSAGE_OVERHEAD = 4
+
+class HistoryWindow:
+    """Picks the newest chat turns that fit into the prompt's token budget.
+
+    The budget is max_prompt_tokens minus the fixed prompt (system
+    messages and greeting), a reserve for the retrieved {context} and the
+    current input. Message token counts are cached by (type, content), so
+    each message is tokenized once however many turns it stays in the window.
+    """
+
+    def __init__(self, max_prompt_tokens=6000, context_tokens=2000, model_name="gpt-4o"):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.context_tokens = context_tokens
+        self.fixed_tokens = 0
+        count = get_token_counter(model_name)
+        self._count = lru_cache(maxsize=8192)(lambda kind, content: count(content) + MESSAGE_OVERHEAD)
+
+    def count_message(self, message):
+        return self._count(message.type, message.content)
+
+    def count_text(self, text):
+        return self._count('text', text) - MESSAGE_OVERHEAD
+
+    def set_fixed_prompt(self, messages):
+        self.fixed_tokens = sum(self.count_message(message) for message in messages)
+
+    def history_budget(self, query):
+        return self.max_prompt_tokens - self.fixed_tokens - self.context_tokens - self.count_text(query)
+
+    def select(self, chat_history, query):
+        """Return (the newest messages within budget, their token total)."""
+        budget = self.history_budget(query)
+        used = 0
+        start = len(chat_history)
+        for i in range(len(chat_history) - 1, -1, -1):
+            tokens = self.count_message(chat_history[i])
+            if used + tokens > budget:
+                break
+            used += tokens
+            start = i
+        window = chat_history[start:]
+        # Don't open the window on an answer whose question was cut off.
+        while window and not isinstance(window[0], HumanMessage):
+            used -= self.count_message(window[0])
+            window = window[1:]
+        return window, used
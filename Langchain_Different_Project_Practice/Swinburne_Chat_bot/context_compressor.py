@@ -0,0 +1,153 @@
+import math
+import os
+from collections import Counter
+from typing import Any, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+
+from embedding_batcher import get_token_counter
+from embedding_cache import embedder_name
+from lexical_index import tokenize
+from sentence_store import SentenceStore, has_sentence_store, split_sentences
+from tracing import span
+
+COMPRESSION_MODES = ('lexical', 'embedding')
+
+def lexical_scores(query, sentences):
+    """Query terms each sentence contains, weighted by how rare they are among
+    the sentences and damped by sentence length, BM25-style."""
+    query_terms = set(tokenize(query))
+    sentence_terms = [Counter(tokenize(sentence)) for sentence in sentences]
+    document_frequency = Counter(term for terms in sentence_terms for term in terms if term in query_terms)
+    count = len(sentences)
+    scores = []
+    for terms in sentence_terms:
+        score = sum(math.log(1 + count / document_frequency[term]) * terms[term] / (terms[term] + 1.2)
+                    for term in query_terms if term in terms)
+        scores.append(score / math.sqrt(1 + sum(terms.values()) / 20))
+    return np.array(scores, dtype=np.float32)
+
+def cosine_scores(query_vector, sentence_vectors):
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    sentence_vectors = np.asarray(sentence_vectors, dtype=np.float32)
+    norms = np.linalg.norm(sentence_vectors, axis=1) * np.linalg.norm(query_vector)
+    return sentence_vectors @ query_vector / np.where(norms == 0, 1, norms)
+
+class QueryFocusedCompressor(BaseDocumentCompressor):
+    """Cuts retrieved chunks down to the sentences most relevant to the query.
+
+    Sentences are scored by lexical overlap with the query ('lexical'), or
+    by cosine similarity of their embeddings to the query's ('embedding').
+    With a sentence_store, embedding mode only reads sentence vectors that
+    were saved with the index, and falls back to lexical
+    scoring when any are missing; without one it embeds the sentences on
+    every call, which is only meant for offline experiments. The best ones are kept
+    until max_tokens is reached and put back in their original order, with
+    an ellipsis where sentences were dropped. If no sentence shares a term
+    with the query, the chunks' opening sentences are kept instead.
+    """
+
+    mode: str = 'lexical'
+    max_tokens: int = 600
+    embedder: Any = None
+    sentence_store: Any = None
+    model_name: str = "gpt-4o"
+    count_tokens: Any = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.mode not in COMPRESSION_MODES:
+            raise ValueError(f"unknown compression mode {self.mode!r}; expected one of {COMPRESSION_MODES}")
+        if self.mode == 'embedding' and self.embedder is None:
+            raise ValueError("embedding compression needs an embedder")
+        if self.count_tokens is None:
+            self.count_tokens = get_token_counter(self.model_name)
+
+    def _sentence_vectors(self, sentences):
+        if self.sentence_store is None:
+            return self.embedder.embed_documents(sentences)
+        vectors = self.sentence_store.get_many(sentences)
+        return None if any(vector is None for vector in vectors) else vectors
+
+    def _scores(self, query, sentences):
+        if self.mode == 'embedding':
+            vectors = self._sentence_vectors(sentences)
+            if vectors is not None:
+                # The retriever has just embedded the query, so this is a query-cache hit.
+                return cosine_scores(self.embedder.embed_query(query), vectors), 'embedding'
+        return lexical_scores(query, sentences), 'lexical'
+
+    def compress_documents(
+        self, documents: Sequence[Document], query: str, callbacks: Optional[Callbacks] = None
+    ) -> Sequence[Document]:
+        with span('compress', mode=self.mode, documents=len(documents)) as compress_span:
+            compressed, before, after, scored_by = self._compress(documents, query)
+            compress_span.set(tokens_before=before, tokens_after=after, scored_by=scored_by)
+        return compressed
+
+    def _compress(self, documents, query):
+        # (document index, sentence) for every sentence of every document, in order.
+        sentences = [(i, sentence) for i, doc in enumerate(documents) for sentence in split_sentences(doc.page_content)]
+        if not sentences:
+            return list(documents), 0, 0, None
+        tokens = [self.count_tokens(sentence) for _, sentence in sentences]
+        scores, scored_by = self._scores(query, [sentence for _, sentence in sentences])
+        # Stable sort, so equal scores keep document order.
+        order = np.argsort(-scores, kind='stable')
+        if scores[order[0]] > 0:
+            # Sentences that share nothing with the query would only pad the prompt.
+            order = order[scores[order] > 0]
+
+        keep = set()
+        used = 0
+        for position in order:
+            if keep and used + tokens[position] > self.max_tokens:
+                continue
+            keep.add(position)
+            used += tokens[position]
+
+        compressed = []
+        for i, doc in enumerate(documents):
+            parts = []
+            previous = None
+            for position, (owner, sentence) in enumerate(sentences):
+                if owner != i or position not in keep:
+                    continue
+                if parts and previous != position - 1:
+                    parts.append("...")
+                parts.append(sentence)
+                previous = position
+            if parts:
+                compressed.append(Document(page_content=" ".join(parts), metadata=dict(doc.metadata)))
+        return compressed, sum(tokens), used, scored_by
+
+def compressor_from_env(embedder, folder_path, model_name="gpt-4o"):
+    """CONTEXT_COMPRESSION=lexical or embedding, within CONTEXT_TOKENS (default 600); unset or off disables it.
+
+    Embedding mode reads its sentence vectors from the index at folder_path,
+    written by create_vector_store.py --sentence-embeddings; without them
+    it falls back to lexical mode.
+    """
+    mode = os.getenv('CONTEXT_COMPRESSION', 'off').lower()
+    if mode in ('', 'off', 'none'):
+        return None
+    sentence_store = None
+    if mode == 'embedding':
+        if has_sentence_store(folder_path):
+            sentence_store = SentenceStore(folder_path)
+            if sentence_store.model_name != embedder_name(embedder):
+                print(f"{folder_path} sentence vectors are from {sentence_store.model_name}, "
+                      f"not {embedder_name(embedder)}; using lexical compression")
+                sentence_store = None
+        else:
+            print(f"{folder_path} has no sentence vectors (build with --sentence-embeddings); "
+                  f"using lexical compression")
+        if sentence_store is None:
+            mode = 'lexical'
+    return QueryFocusedCompressor(mode=mode, max_tokens=int(os.getenv('CONTEXT_TOKENS', '600')),
+                                  embedder=embedder, sentence_store=sentence_store, model_name=model_name)
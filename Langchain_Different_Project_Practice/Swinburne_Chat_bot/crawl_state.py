@@ -0,0 +1,118 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+class CrawlState:
+    """Per-URL crawl state kept between runs: ETag, Last-Modified, sitemap <lastmod> and body hash.
+
+    Lookups read the database; record() only stages the new state in
+    memory until flush(), which commits it for the pages that made it into
+    the saved index. A run that dies before its index is saved, or a page
+    that fails to index, is fetched again next time instead of skipped.
+    """
+
+    def __init__(self, path='crawl_state.sqlite'):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS crawl_state ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, sitemap_lastmod TEXT, "
+            "fetched_lastmod TEXT, body_hash TEXT, fetched_at REAL)"
+        )
+        self._conn.commit()
+        self._pending = {}
+        self.not_modified = 0
+        self.lastmod_unchanged = 0
+        self.body_unchanged = 0
+        self.fetched = 0
+        self.dropped = 0
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, sitemap_lastmod, fetched_lastmod, body_hash "
+                "FROM crawl_state WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('etag', 'last_modified', 'sitemap_lastmod', 'fetched_lastmod', 'body_hash'), row))
+
+    def set_sitemap_lastmod(self, lastmod):
+        """Store the <lastmod> of each URL from a sitemap crawl (url -> lastmod or None)."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO crawl_state (url, sitemap_lastmod) VALUES (?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET sitemap_lastmod = excluded.sitemap_lastmod",
+                list(lastmod.items())
+            )
+            self._conn.commit()
+
+    def conditional_headers(self, state):
+        headers = {}
+        if state and state['etag']:
+            headers['If-None-Match'] = state['etag']
+        if state and state['last_modified']:
+            headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
+    def is_unchanged_in_sitemap(self, state):
+        """True if the sitemap's <lastmod> is the one we saw when we last fetched the page."""
+        if state is None or not state['sitemap_lastmod'] or not state['body_hash']:
+            return False
+        if state['sitemap_lastmod'] == state['fetched_lastmod']:
+            with self._lock:
+                self.lastmod_unchanged += 1
+            return True
+        return False
+
+    def mark_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def record(self, url, state, response, body):
+        """Stage the state for a 200 response; return False if the body is identical to last time."""
+        body_hash = hashlib.sha256(body).hexdigest()
+        unchanged = state is not None and state['body_hash'] == body_hash
+        with self._lock:
+            self._pending[url] = (
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'),
+                state['sitemap_lastmod'] if state else None,
+                body_hash,
+                time.time(),
+            )
+            if unchanged:
+                self.body_unchanged += 1
+            else:
+                self.fetched += 1
+        return not unchanged
+
+    def flush(self, urls):
+        """Commit the staged state of urls, the pages now saved in the index; drop the rest."""
+        urls = set(urls)
+        with self._lock:
+            rows = [(url, *values) for url, values in self._pending.items() if url in urls]
+            self.dropped = len(self._pending) - len(rows)
+            self._conn.executemany(
+                "INSERT INTO crawl_state (url, etag, last_modified, fetched_lastmod, body_hash, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+                "fetched_lastmod = excluded.fetched_lastmod, body_hash = excluded.body_hash, "
+                "fetched_at = excluded.fetched_at",
+                rows
+            )
+            self._conn.commit()
+            self._pending = {}
+
+    def forget(self, urls):
+        """Delete the state of pages that were removed from the index, so their return is a full fetch."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM crawl_state WHERE url = ?", [(url,) for url in urls])
+            self._conn.commit()
+
+    def report(self):
+        print(f"Crawl state: {self.fetched} changed, {self.not_modified} not modified (304), "
+              f"{self.lastmod_unchanged} skipped by sitemap lastmod, {self.body_unchanged} identical bodies")
+        if self.dropped:
+            print(f"Crawl state: not saved for {self.dropped} fetched pages that did not make it into the index")
@@ -1,73 +1,198 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain_community.document_loaders import WebBaseLoader
 from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
 from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from urls_list import urls
-
+from ann_index import INDEX_TYPES, QUANTIZERS, build_ann_index, load_ann_config
+from embedding_batcher import EmbeddingBatcher, MAX_TOKENS
+from crawl_state import CrawlState
+from embedding_cache import EmbeddingCache, embedder_name
+from index_manifest import IncrementalUpdate, SourceManifest
+from lexical_index import build_lexical_index
+from sentence_store import build_sentence_store
+from ingest_pipeline import IngestionFailed, IngestionPipeline
+from sharded_build import run_sharded_build
+from url_store import DEFAULT_PATH as URL_STORE_PATH, UrlStore
+
+import argparse
 import os
 
-os.environ["USER_AGENT"] = os.getenv('USER_AGENT')
-
-def storeVector(urls):
-    embedder = OpenAIEmbeddings(openai_api_key = os.getenv('OPENAI_API_KEY'))
-    splitter = RecursiveCharacterTextSplitter()
+def get_embedder(fake_embedding_size=None):
+    if fake_embedding_size:
+        return DeterministicFakeEmbedding(size=fake_embedding_size)
+    return OpenAIEmbeddings(openai_api_key = os.getenv('OPENAI_API_KEY'))
+
+def storeVector(urls, embedder=None, vector_store=None, **pipeline_options):
+    pipeline = IngestionPipeline(embedder or get_embedder(), **pipeline_options)
+    return pipeline.run(urls, vector_store)
+
+def load_urls(args):
+    if args.urls_file:
+        with open(args.urls_file) as file:
+            urls = [line.strip() for line in file if line.strip()]
+        return urls[args.start:args.end]
+    store = UrlStore(args.url_store)
+    if not len(store):
+        raise SystemExit(f"{args.url_store} is empty; run: python url_store.py migrate")
+    if args.host or args.path_prefix:
+        return list(store.filter(args.host, args.path_prefix))[args.start:args.end]
+    return store.slice(args.start, args.end)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the Swinburne FAISS index from a list of URLs.")
+    parser.add_argument('--urls-file', help="newline-separated URLs to ingest instead of the URL store")
+    parser.add_argument('--url-store', default=URL_STORE_PATH, help="URL store to read from")
+    parser.add_argument('--host', help="only ingest stored URLs on this host")
+    parser.add_argument('--path-prefix', help="only ingest stored URLs whose path starts with this")
+    parser.add_argument('--start', type=int, default=0, help="first URL index to ingest")
+    parser.add_argument('--end', type=int, default=None, help="URL index to stop before")
+    parser.add_argument('--output', default='Swinburne_Chat_Bot', help="directory to save the index to")
+    parser.add_argument('--update', action='store_true',
+                        help="update the index in --output in place: re-embed only new or changed pages")
+    parser.add_argument('--prune', action='store_true',
+                        help="with --update, also delete pages that are no longer in the URL list")
+    parser.add_argument('--fetch-workers', type=int, default=16)
+    parser.add_argument('--parse-workers', type=int, default=4)
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help="parse in a process pool of this size instead of in the parse threads")
+    parser.add_argument('--split-workers', type=int, default=2)
+    parser.add_argument('--embed-workers', type=int, default=4)
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--batch-inputs', type=int, default=None,
+                        help="max chunks per embedding request (default: the embedder's chunk_size)")
+    parser.add_argument('--batch-tokens', type=int, default=MAX_TOKENS,
+                        help="max tokens per embedding request")
+    parser.add_argument('--embedding-cache', default='embedding_cache.sqlite',
+                        help="on-disk embedding cache ('' to disable)")
+    parser.add_argument('--embedding-cache-mb', type=int, default=2048,
+                        help="evict least recently used embeddings above this size")
+    parser.add_argument('--sentence-embeddings', action='store_true',
+                        help="also save a vector for every chunk sentence with the index, for CONTEXT_COMPRESSION=embedding")
+    parser.add_argument('--crawl-state', default='crawl_state.sqlite',
+                        help="per-URL ETag/Last-Modified/lastmod store; --update sends conditional requests ('' to disable)")
+    parser.add_argument('--fake-embeddings', type=int, metavar='DIM',
+                        help="use deterministic fake embeddings of this size (offline runs)")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="split the URLs into this many shards, build them in parallel and merge them")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help="processes to build and merge shards with")
+    parser.add_argument('--index-type', choices=INDEX_TYPES,
+                        help="also build an IVF-Flat or HNSW index for search (default: keep the output's current type, else flat)")
+    parser.add_argument('--ivf-nlist', type=int, help="IVF lists (default: about 4*sqrt(vectors))")
+    parser.add_argument('--ivf-train-size', type=int, help="vectors to train IVF on (default: 64 per list)")
+    parser.add_argument('--nprobe', type=int, help="default IVF lists searched per query (default: tuned for 0.95 recall@10)")
+    parser.add_argument('--hnsw-m', type=int, default=32)
+    parser.add_argument('--hnsw-ef-construction', type=int, default=80)
+    parser.add_argument('--ef-search', type=int, help="default HNSW search breadth (default: tuned for 0.95 recall@10)")
+    parser.add_argument('--quantize', choices=('none',) + QUANTIZERS,
+                        help="keep only fp16/int8/PQ codes in memory and re-rank from an on-disk float file "
+                             "(default: keep the output's current setting, else none)")
+    parser.add_argument('--pq-m', type=int, help="PQ sub-quantizers (default: dimension / 4, a 16x reduction)")
+    parser.add_argument('--rerank', type=int,
+                        help="with --quantize, re-score this many candidates per result exactly "
+                             "(default: doubled from 4 until 0.95 recall@10)")
+    args = parser.parse_args()
+    if args.shards and args.update:
+        parser.error("--shards builds a fresh index; it cannot be combined with --update")
+    return args
+
+def get_batcher(embedder, args):
+    cache = None
+    if args.embedding_cache:
+        cache = EmbeddingCache(args.embedding_cache, embedder_name(embedder),
+                               max_bytes=args.embedding_cache_mb * 1024 ** 2)
+    return EmbeddingBatcher(embedder, max_inputs=args.batch_inputs,
+                            max_tokens=args.batch_tokens, cache=cache)
+
+def build_search_indexes(vector_store, output, args, batcher=None):
+    """Rebuild the indexes derived from the saved flat store: BM25, IVF/HNSW/quantized
+    and sentence vectors, as configured.
+
+    Returns {'sentences': count} if some sentences could not be embedded, else {}.
+    """
+    build_lexical_index(vector_store, output)
+    config = load_ann_config(output) or {}
+    index_type = args.index_type or config.get('type', 'flat')
+    quantize = config.get('quantize') if args.quantize is None else args.quantize
+    build_ann_index(vector_store, output, index_type, quantize=None if quantize == 'none' else quantize,
+                    nlist=args.ivf_nlist, train_size=args.ivf_train_size,
+                    m=args.hnsw_m, ef_construction=args.hnsw_ef_construction,
+                    pq_m=args.pq_m, rerank=args.rerank, nprobe=args.nprobe, ef_search=args.ef_search)
+    if args.sentence_embeddings:
+        failed = build_sentence_store(vector_store, output, batcher or get_batcher(vector_store.embeddings, args))
+        if failed:
+            return {'sentences': failed}
+    return {}
+
+def build_index(args, urls, output):
+    """Ingest urls into the index at output; returns the number of vectors saved (0 if none).
+
+    What was ingested is saved either way, but if any stage dropped items
+    this raises IngestionFailed afterwards. Pages that fail with a permanent
+    client error are only reported, and removed from an updated index.
+    """
+    embedder = get_embedder(args.fake_embeddings)
+    batcher = get_batcher(embedder, args)
+    crawl_state = CrawlState(args.crawl_state) if args.crawl_state else None
 
-    batch_size = 1
     vector_store = None
-
-    for i in range(6000, 6037, batch_size):
-        print("Iteration: ", i)
-        batch_urls = urls[i:i+batch_size]
-
-        splitted_docs = splitter.split_documents(WebBaseLoader(batch_urls).load())
-
-        if vector_store is None:
-            vector_store = FAISS.from_documents(splitted_docs, embedder)
+    manifest = SourceManifest()
+    if args.update and os.path.exists(output):
+        vector_store = FAISS.load_local(output, embedder, index_name="index",
+                                        allow_dangerous_deserialization=True)
+        manifest = SourceManifest.load(output)
+    update = IncrementalUpdate(manifest)
+    if args.update and args.prune:
+        update.prune(urls)
+
+    vector_store, failures = storeVector(
+        urls,
+        embedder=embedder,
+        vector_store=vector_store,
+        batcher=batcher,
+        update=update,
+        crawl_state=crawl_state,
+        # Only skip unchanged pages when they are already in the index being updated.
+        conditional=args.update and vector_store is not None,
+        fetch_workers=args.fetch_workers,
+        parse_workers=args.parse_workers,
+        parse_processes=args.parse_processes,
+        split_workers=args.split_workers,
+        embed_workers=args.embed_workers,
+        queue_size=args.queue_size
+    )
+    if vector_store is None:
+        print("No documents were ingested")
+        if failures:
+            raise IngestionFailed(failures)
+        return 0
+    update.apply(vector_store)
+    vector_store.save_local(output)
+    manifest.save(output)
+    if not args.shards:
+        failures.update(build_search_indexes(vector_store, output, args, batcher))
+    if crawl_state is not None:
+        # Only now that the index and manifest are on disk, and only for the pages
+        # in them: a page that failed keeps its old state and is fetched again.
+        crawl_state.flush(update.indexed_urls())
+        crawl_state.forget(update.removed_urls())
+        crawl_state.report()
+    print(f"Saved {vector_store.index.ntotal} vectors to {output}")
+    if failures:
+        raise IngestionFailed(failures)
+    return vector_store.index.ntotal
+
+def main():
+    args = parse_args()
+    urls = load_urls(args)
+    try:
+        if args.shards:
+            run_sharded_build(urls, args, build_index, build_search_indexes, get_embedder(args.fake_embeddings))
         else:
-            new_vector_store = FAISS.from_documents(splitted_docs, embedder)
-            vector_store.merge_from(new_vector_store)
-
-    return vector_store
-
-    
-
-#splitter = RecursiveCharacterTextSplitter()
-#embedder = OpenAIEmbeddings(openai_api_key = os.getenv('OPENAI_API_KEY'))
-
-#splitted_docs = splitter.split_documents(WebBaseLoader(urls).load())
-
-#vector_store = FAISS.from_documents(splitted_docs, embedder)
-#vector_store.save_local("Swinburne_Chat_Bot")
-
-#vector_store = storeVector(urls)
-#vector_store.save_local("Swinburne_Chat_Bot")
-
-#embedder = OpenAIEmbeddings(openai_api_key = os.getenv('OPENAI_API_KEY'))
-#old_vector_store = FAISS.load_local('Swinburne_Chat_Bot', embedder, index_name="index", allow_dangerous_deserialization=True)
-#vector_store.merge_from(old_vector_store)
-#vector_store.save_local("Swinburne_Chat_Bot-6000-6036")
-
-
-# embedder = OpenAIEmbeddings(openai_api_key = os.getenv('OPENAI_API_KEY'))
-# vector_store = FAISS.load_local('Swinburne_Chat_Bot-0-499', embedder, index_name="index", allow_dangerous_deserialization=True)
-# vector_store_500_999 = FAISS.load_local('Swinburne_Chat_Bot-500-999', embedder, index_name="index", allow_dangerous_deserialization=True)
-# vector_store_1000_1999 = FAISS.load_local('Swinburne_Chat_Bot-1000-1999', embedder, index_name="index", allow_dangerous_deserialization=True)
-# vector_store_2000_2500 = FAISS.load_local('Swinburne_Chat_Bot-2000-2500', embedder, index_name="index", allow_dangerous_deserialization=True)
-# vector_store_2500_3499 = FAISS.load_local('Swinburne_Chat_Bot-2500-3499', embedder, index_name="index", allow_dangerous_deserialization=True)
-# vector_store_3500_4000 = FAISS.load_local('Swinburne_Chat_Bot-3500-4000', embedder, index_name="index", allow_dangerous_deserialization=True)
-# vector_store_4000_5000 = FAISS.load_local('Swinburne_Chat_Bot-4000-5000', embedder, index_name="index", allow_dangerous_deserialization=True)
-# vector_store_5000_6000 = FAISS.load_local('Swinburne_Chat_Bot-5000-6000', embedder, index_name="index", allow_dangerous_deserialization=True)
-# vector_store_6000_6036 = FAISS.load_local('Swinburne_Chat_Bot-6000-6036', embedder, index_name="index", allow_dangerous_deserialization=True)
+            build_index(args, urls, args.output)
+    except IngestionFailed as e:
+        raise SystemExit(f"Build incomplete: {e}; rerun the same command to retry them")
 
-# vector_store.merge_from(vector_store_500_999)
-# vector_store.merge_from(vector_store_1000_1999)
-# vector_store.merge_from(vector_store_2000_2500)
-# vector_store.merge_from(vector_store_2500_3499)
-# vector_store.merge_from(vector_store_3500_4000)
-# vector_store.merge_from(vector_store_4000_5000)
-# vector_store.merge_from(vector_store_5000_6000)
-# vector_store.merge_from(vector_store_6000_6036)
-vector_store.save_local("Swinburne_Chat_Bot")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+
+import openai
+import tiktoken
+
+# OpenAI caps a single embeddings request at 2048 inputs and 300k tokens.
+MAX_INPUTS = 2048
+MAX_TOKENS = 300_000
+
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx
+# responses (APITimeoutError is an APIConnectionError).
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+def get_token_counter(model_name):
+    """Return a text -> token count function for model_name.
+
+    tiktoken downloads its BPE files on first use; when that is impossible
+    (offline builds) fall back to the usual ~4 characters per token estimate.
+    """
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"tiktoken unavailable ({e}); estimating tokens from length")
+        return lambda text: len(text) // 4 + 1
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+class EmbeddingBatch:
+    def __init__(self, chunks=None, vectors=None):
+        self.chunks = chunks or []
+        self.tokens = 0
+        # Set when every chunk was found in the embedding cache.
+        self.vectors = vectors
+
+class EmbeddingBatcher:
+    """Packs chunks from many pages into embedding requests filled up to the provider limits.
+
+    pack() and flush() hand back full batches; embed() sends one batch,
+    retrying rate limits, timeouts, connection errors and 5xx responses with
+    exponential backoff, and raising once the retries run out so the
+    pipeline counts the batch as dropped. Vectors come back in the same
+    order as batch.chunks. With an EmbeddingCache, chunks that are
+    already cached skip the request queue entirely.
+    """
+
+    def __init__(self, embedder, max_inputs=None, max_tokens=MAX_TOKENS, max_retries=6,
+                 backoff=1.0, max_backoff=60.0, cache=None):
+        self.embedder = embedder
+        self.cache = cache
+        # OpenAIEmbeddings splits anything larger than its chunk_size into several requests.
+        self.max_inputs = max_inputs or min(getattr(embedder, 'chunk_size', MAX_INPUTS), MAX_INPUTS)
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.count_tokens = get_token_counter(getattr(embedder, 'model', 'text-embedding-ada-002'))
+        self._batch = EmbeddingBatch()
+        self._lock = threading.Lock()
+        self.chunks = 0
+        self.tokens = 0
+        self.requests = 0
+        self.retries = 0
+        self.failed_batches = 0
+        self.failed_chunks = 0
+
+    def pack(self, chunks):
+        """Add one page's chunks; return the batches that are now full."""
+        full = []
+        if self.cache is not None:
+            chunks = self._take_cached(chunks, full)
+        with self._lock:
+            for chunk in chunks:
+                tokens = self.count_tokens(chunk.page_content)
+                batch = self._batch
+                if batch.chunks and (len(batch.chunks) >= self.max_inputs
+                                     or batch.tokens + tokens > self.max_tokens):
+                    full.append(batch)
+                    batch = self._batch = EmbeddingBatch()
+                batch.chunks.append(chunk)
+                batch.tokens += tokens
+        return full
+
+    def _take_cached(self, chunks, full):
+        """Move cached chunks into a ready batch and return the ones still to embed."""
+        vectors = self.cache.get_many([chunk.page_content for chunk in chunks])
+        cached = EmbeddingBatch(vectors=[])
+        missing = []
+        for chunk, vector in zip(chunks, vectors):
+            if vector is None:
+                missing.append(chunk)
+            else:
+                cached.chunks.append(chunk)
+                cached.vectors.append(vector)
+        if cached.chunks:
+            full.append(cached)
+        return missing
+
+    def flush(self):
+        """Return the last, partially filled batch."""
+        with self._lock:
+            batch, self._batch = self._batch, EmbeddingBatch()
+        return [batch] if batch.chunks else []
+
+    def embed(self, batch):
+        if batch.vectors is not None:
+            return batch.vectors
+        texts = [chunk.page_content for chunk in batch.chunks]
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self.embedder.embed_documents(texts)
+                break
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failed_batches += 1
+                        self.failed_chunks += len(batch.chunks)
+                    raise
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay * random.uniform(0.5, 1.0))
+        if self.cache is not None:
+            self.cache.put_many(texts, vectors)
+
+        with self._lock:
+            self.requests += 1
+            self.chunks += len(batch.chunks)
+            self.tokens += batch.tokens
+        return vectors
+
+    def report(self, elapsed):
+        elapsed = max(elapsed, 1e-9)
+        print(f"Embedded {self.chunks} chunks ({self.tokens} tokens) in {self.requests} requests, "
+              f"{self.retries} retries: "
+              f"{self.chunks / elapsed:.1f} chunks/s, {self.tokens / elapsed:.0f} tokens/s")
+        if self.failed_batches:
+            print(f"Gave up on {self.failed_batches} batches ({self.failed_chunks} chunks) after {self.max_retries} retries")
+        if self.cache is not None:
+            self.cache.report()
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from tracing import span
+
+def embedder_name(embedder):
+    """Name that identifies which vectors an embedder produces, for cache keys."""
+    model = getattr(embedder, 'model', None)
+    if model:
+        return model
+    return f"{type(embedder).__name__}-{getattr(embedder, 'size', '')}"
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by sha256(model name, normalized text).
+
+    Entries are evicted least-recently-used first once the stored vectors
+    exceed max_bytes.
+    """
+
+    def __init__(self, path, model_name, max_bytes=2 * 1024 ** 3):
+        self.path = path
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def get_many(self, texts):
+        """Return a vector or None for each text, in order."""
+        keys = [self.key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts, vectors):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = array('f', vector).tobytes()
+            rows.append((self.key(text), blob, len(blob), now))
+        with self._lock:
+            for key, blob, size, _ in rows:
+                old = self._conn.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self.total_bytes += size - (old[0] if old else 0)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            removed = []
+            for key, size in rows:
+                removed.append((key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", removed)
+            self.evictions += len(removed)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        print(f"Embedding cache: {self.hits} hits, {self.misses} misses "
+              f"({self.hit_rate():.1%} hit rate), {self.evictions} evicted, "
+              f"{self.total_bytes / 1024 ** 2:.1f} MB stored")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class CachedQueryEmbeddings(Embeddings):
+    """Wraps an embedder so repeated queries skip the embedding call.
+
+    Queries are keyed by their case-folded, whitespace-normalized text. The
+    first tier is an in-memory LRU of max_entries vectors; an optional
+    EmbeddingCache is the second, on-disk tier. Documents pass straight through.
+    """
+
+    def __init__(self, embedder, max_entries=1024, disk_cache=None):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.memory_misses = 0
+
+    @property
+    def model(self):
+        return embedder_name(self.embedder)
+
+    def embed_documents(self, texts):
+        return self.embedder.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embedder.aembed_documents(texts)
+
+    def _lookup(self, key):
+        vector = self._memory_lookup(key)
+        if vector is None:
+            vector = self._disk_lookup(key)
+        return vector
+
+    def _memory_lookup(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+            self.memory_misses += 1
+        return None
+
+    def _disk_lookup(self, key):
+        if self.disk_cache is None:
+            return None
+        vector = self.disk_cache.get_many([key])[0]
+        if vector is not None:
+            self._remember(key, vector)
+        return vector
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, vector):
+        self._remember(key, vector)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many([key], [vector])
+
+    def embed_query(self, text):
+        with span('embed_query') as embed_span:
+            key = normalize_text(text).casefold()
+            vector = self._lookup(key)
+            embed_span.set(cached=vector is not None)
+            if vector is None:
+                vector = self.embedder.embed_query(text)
+                self._store(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        with span('embed_query') as embed_span:
+            key = normalize_text(text).casefold()
+            vector = self._memory_lookup(key)
+            if vector is None and self.disk_cache is not None:
+                # The disk tier is SQLite; don't block the event loop on it.
+                vector = await asyncio.to_thread(self._disk_lookup, key)
+            embed_span.set(cached=vector is not None)
+            if vector is None:
+                vector = await self.embedder.aembed_query(text)
+                if self.disk_cache is None:
+                    self._remember(key, vector)
+                else:
+                    await asyncio.to_thread(self._store, key, vector)
+        return vector
+
+    def stats(self):
+        stats = {'memory_hits': self.memory_hits, 'memory_misses': self.memory_misses,
+                 'memory_entries': len(self._memory)}
+        if self.disk_cache is not None:
+            stats.update(disk_hits=self.disk_cache.hits, disk_misses=self.disk_cache.misses)
+        return stats
@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+
+import numpy as np
+from aiohttp import web
+
+FILLER = ("Swinburne students can find this information on the university website or by contacting "
+          "Student HQ, who are happy to help with enrolment, fees, timetables and support services.").split()
+
+class FakeOpenAI:
+    """Local stand-in for the OpenAI chat-completions and embeddings endpoints.
+
+    Replies arrive after `latency` (+/- `jitter`) seconds and then stream at
+    `tokens_per_second`; `error_rate` of requests fail with a 429 or 500 in
+    OpenAI's error format, so client retries are exercised too. Embeddings
+    are deterministic per input text.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.1, tokens_per_second=50.0, completion_tokens=60,
+                 error_rate=0.0, embedding_latency=0.05, embedding_dim=1536, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.embedding_latency = embedding_latency
+        self.embedding_dim = embedding_dim
+        self.random = random.Random(seed)
+        self.requests = {'chat': 0, 'embeddings': 0, 'errors': 0}
+
+    def _injected_error(self):
+        if self.random.random() >= self.error_rate:
+            return None
+        self.requests['errors'] += 1
+        if self.random.random() < 0.5:
+            status, kind, message = 429, 'rate_limit_error', "Rate limit reached (injected by fake server)"
+        else:
+            status, kind, message = 500, 'server_error', "The server had an error (injected by fake server)"
+        return web.json_response({'error': {'message': message, 'type': kind, 'param': None, 'code': None}},
+                                 status=status)
+
+    async def _wait(self, seconds):
+        await asyncio.sleep(max(0.0, seconds + self.random.uniform(-self.jitter, self.jitter)))
+
+    def _answer_tokens(self, messages):
+        question = next((m.get('content') for m in reversed(messages) if m.get('role') == 'user'), '') or ''
+        if not isinstance(question, str):
+            question = json.dumps(question)
+        words = f"(simulated answer to: {question[:80]})".split()
+        words += [FILLER[i % len(FILLER)] for i in range(max(0, self.completion_tokens - len(words)))]
+        return [word + ' ' for word in words[:self.completion_tokens]]
+
+    @staticmethod
+    def _prompt_tokens(messages):
+        return sum(len(json.dumps(m.get('content', ''))) // 4 + 4 for m in messages)
+
+    async def chat_completions(self, request):
+        self.requests['chat'] += 1
+        body = await request.json()
+        error = self._injected_error()
+        if error is not None:
+            return error
+        messages = body.get('messages', [])
+        tokens = self._answer_tokens(messages)
+        usage = {'prompt_tokens': self._prompt_tokens(messages), 'completion_tokens': len(tokens)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get('model', 'gpt-4o')
+        created = int(time.time())
+
+        await self._wait(self.latency)
+        if not body.get('stream'):
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+            return web.json_response({
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'logprobs': None,
+                             'message': {'role': 'assistant', 'content': ''.join(tokens)}}],
+                'usage': usage,
+            })
+
+        include_usage = (body.get('stream_options') or {}).get('include_usage', False)
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+
+        async def send(choices, usage=None):
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                     'model': model, 'choices': choices}
+            if include_usage:
+                chunk['usage'] = usage
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+
+        await send([{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}])
+        for token in tokens:
+            await send([{'index': 0, 'delta': {'content': token}, 'finish_reason': None}])
+            await asyncio.sleep(1 / self.tokens_per_second)
+        await send([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        if include_usage:
+            await send([], usage)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    def _embedding(self, text, dim):
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    async def embeddings(self, request):
+        self.requests['embeddings'] += 1
+        body = await request.json()
+        error = self._injected_error()
+        if error is not None:
+            return error
+        inputs = body.get('input', [])
+        # A single string or token list, or a batch of either.
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dim = body.get('dimensions') or self.embedding_dim
+        data = []
+        tokens = 0
+        for i, item in enumerate(inputs):
+            text = item if isinstance(item, str) else ' '.join(map(str, item))
+            tokens += len(item) if isinstance(item, list) else len(item) // 4 + 1
+            vector = self._embedding(text, dim)
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii')
+            else:
+                embedding = vector.tolist()
+            data.append({'object': 'embedding', 'index': i, 'embedding': embedding})
+        await self._wait(self.embedding_latency)
+        return web.json_response({
+            'object': 'list', 'data': data, 'model': body.get('model', 'text-embedding-ada-002'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        })
+
+    async def stats(self, request):
+        return web.json_response(self.requests)
+
+def create_app(**options):
+    fake = FakeOpenAI(**options)
+    application = web.Application(client_max_size=64 * 1024 ** 2)
+    application['fake'] = fake
+    application.add_routes([
+        web.post('/v1/chat/completions', fake.chat_completions),
+        web.post('/v1/embeddings', fake.embeddings),
+        web.get('/v1/stats', fake.stats),
+    ])
+    return application
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve fake OpenAI chat and embedding endpoints; point clients at it with "
+                    "OPENAI_BASE_URL=http://HOST:PORT/v1")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument('--jitter', type=float, default=0.1, help="+/- seconds added to every latency")
+    parser.add_argument('--tokens-per-second', type=float, default=50.0)
+    parser.add_argument('--completion-tokens', type=int, default=60, help="tokens per answer")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered 429/500")
+    parser.add_argument('--embedding-latency', type=float, default=0.05)
+    parser.add_argument('--embedding-dim', type=int, default=1536)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    options = vars(args)
+    host, port = options.pop('host'), options.pop('port')
+    web.run_app(create_app(**options), host=host, port=port)
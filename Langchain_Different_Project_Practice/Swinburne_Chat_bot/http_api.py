@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+
+from aiohttp import web
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, AIMessage
+
+from app import ChatBot, VectorDBHolder
+from semantic_cache import SemanticCache
+from usage_store import UsageStore
+
+# Upper bound on /retrieve's k, so one request cannot ask for the whole index.
+MAX_K = 100
+
+class ChatService:
+    """Shares one loaded VectorDB, and one ChatBot built on it, across every request."""
+
+    def __init__(self, holder, llm=None, use_answer_cache=True, usage_store=None):
+        self.holder = holder
+        self.llm = llm
+        self.usage_store = usage_store
+        self.answer_cache = None
+        if use_answer_cache:
+            self.answer_cache = SemanticCache(
+                holder.get().embedder,
+                threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95')),
+                ttl=float(os.getenv('SEMANTIC_CACHE_TTL', str(24 * 3600)))
+            )
+            holder.on_reload.append(self.answer_cache.invalidate)
+        self._chatbot = None
+        self._chatbot_version = None
+        self._lock = threading.Lock()
+
+    def get_chatbot(self):
+        """Blocking: may reload the index from disk, so handlers call it through in_thread()."""
+        vector_db = self.holder.get()
+        with self._lock:
+            if self._chatbot is None or self._chatbot_version != self.holder.version:
+                self._chatbot = ChatBot(vector_db, llm=self.llm, answer_cache=self.answer_cache,
+                                        usage_store=self.usage_store)
+                self._chatbot_version = self.holder.version
+            return self._chatbot
+
+async def in_thread(func, *args):
+    """Run a blocking call (index stat or reload, ChatBot setup) off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+def parse_history(history):
+    if history is None:
+        return []
+    if not isinstance(history, list) or not all(
+            isinstance(msg, dict) and isinstance(msg.get('content'), str) for msg in history):
+        raise web.HTTPBadRequest(text="'history' must be a list of {\"role\", \"content\"} objects")
+    messages = []
+    for msg in history:
+        if msg.get('role') == 'user':
+            messages.append(HumanMessage(content=msg['content']))
+        elif msg.get('role') == 'assistant':
+            messages.append(AIMessage(content=msg['content']))
+    return messages
+
+async def read_query(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="request body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="request body must be a JSON object")
+    query = body.get('query')
+    if not isinstance(query, str) or not query.strip():
+        raise web.HTTPBadRequest(text="'query' is required and must be a string")
+    if not isinstance(body.get('session_id'), (str, type(None))):
+        raise web.HTTPBadRequest(text="'session_id' must be a string")
+    return body, query.strip()
+
+def read_k(body):
+    k = body.get('k', 4)
+    # bool is an int subclass, but true/false is not a count.
+    if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= MAX_K:
+        raise web.HTTPBadRequest(text=f"'k' must be an integer from 1 to {MAX_K}")
+    return k
+
+async def health(request):
+    holder = request.app['service'].holder
+    vector_db = await in_thread(holder.get)
+    return web.json_response({
+        'status': 'ok',
+        'vectors': vector_db.vector_store.index.ntotal,
+        'index_version': holder.version,
+    })
+
+async def chat(request):
+    body, query = await read_query(request)
+    chat_history = parse_history(body.get('history'))
+    chatbot = await in_thread(request.app['service'].get_chatbot)
+    answer, usage = await chatbot.aprocess_chat(query, chat_history, body.get('session_id'))
+    return web.json_response({'answer': answer, 'usage': usage})
+
+async def chat_stream(request):
+    """Server-sent events: one `token` event per chunk, then a `done` event with the full answer.
+
+    If generation fails once the stream has started, an `error` event takes
+    the place of `done`.
+    """
+    body, query = await read_query(request)
+    chat_history = parse_history(body.get('history'))
+    chatbot = await in_thread(request.app['service'].get_chatbot)
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+    })
+    await response.prepare(request)
+    tokens = []
+    try:
+        async for token in chatbot.astream_chat(query, chat_history, body.get('session_id')):
+            tokens.append(token)
+            await response.write(f"event: token\ndata: {json.dumps(token)}\n\n".encode('utf-8'))
+        done = json.dumps({'answer': ''.join(tokens)})
+        await response.write(f"event: done\ndata: {done}\n\n".encode('utf-8'))
+    except ConnectionResetError:
+        # The client went away; stop generating for it.
+        pass
+    except Exception as e:
+        print(f"Error streaming chat: {type(e).__name__}: {e}")
+        error = json.dumps({'error': "the answer could not be generated"})
+        try:
+            await response.write(f"event: error\ndata: {error}\n\n".encode('utf-8'))
+        except ConnectionResetError:
+            pass
+    return response
+
+async def retrieve(request):
+    body, query = await read_query(request)
+    k = read_k(body)
+    vector_store = (await in_thread(request.app['service'].holder.get)).vector_store
+    results = await vector_store.asimilarity_search_with_score(query, k=k)
+    return web.json_response({'documents': [
+        {'content': doc.page_content, 'metadata': doc.metadata, 'score': float(score)}
+        for doc, score in results
+    ]})
+
+def create_app(vector_path='Swinburne_Chat_Bot', embedder=None, llm=None, use_answer_cache=True, usage_path=None):
+    """Build the aiohttp application; pass a fake embedder and llm to run it offline.
+
+    With usage_path, every chat request's tokens and cost are logged there,
+    under the session_id the client sends in the request body.
+    """
+    holder = VectorDBHolder(vector_path, embedder=embedder)
+    application = web.Application()
+    usage_store = UsageStore(usage_path) if usage_path else None
+    application['service'] = ChatService(holder, llm=llm, use_answer_cache=use_answer_cache,
+                                         usage_store=usage_store)
+    application.add_routes([
+        web.get('/health', health),
+        web.post('/chat', chat),
+        web.post('/chat/stream', chat_stream),
+        web.post('/retrieve', retrieve),
+    ])
+    return application
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Serve the Swinburne ChatBot over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--index', default='Swinburne_Chat_Bot')
+    parser.add_argument('--no-answer-cache', action='store_true')
+    parser.add_argument('--usage-db', default=os.getenv('USAGE_DB', 'usage.sqlite'),
+                        help="SQLite file for per-request token usage and cost ('' to disable)")
+    args = parser.parse_args()
+    web.run_app(create_app(args.index, use_answer_cache=not args.no_answer_cache, usage_path=args.usage_db),
+                host=args.host, port=args.port)
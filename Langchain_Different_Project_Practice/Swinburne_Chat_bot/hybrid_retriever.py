@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, List
+
+import numpy as np
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from tracing import span
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """Merge ranked lists of ids: each id scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+
+    Ties keep the order in which ids were first seen, so earlier lists win them.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class HybridRetriever(BaseRetriever):
+    """Fuses FAISS nearest neighbours with BM25 matches by reciprocal rank.
+
+    Exact terms such as unit codes and building names are found by the
+    lexical side even when their embedding lands far from the chunk's.
+    """
+
+    vector_store: FAISS
+    lexical_index: Any
+    k: int = 1
+    fetch_k: int = 20
+    rrf_k: int = 60
+    # Lexical matches scoring under this fraction of the best one share only
+    # common words with the query; fusing them would just promote dense noise.
+    lexical_cutoff: float = 0.1
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _dense_rows(self, embedding):
+        vector = np.array([embedding], dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            dependable_faiss_import().normalize_L2(vector)
+        _, rows = self.vector_store.index.search(vector, self.fetch_k)
+        return [int(row) for row in rows[0] if row != -1]
+
+    def _fuse(self, query, embedding):
+        with span('bm25.search', fetch_k=self.fetch_k) as lexical_span:
+            matches = self.lexical_index.search(query, self.fetch_k)
+            lexical_span.set(matches=len(matches))
+        lexical_rows = [row for row, score in matches if score >= matches[0][1] * self.lexical_cutoff]
+        # Lexical first: equal fused scores go to the exact-term match.
+        rows = reciprocal_rank_fusion([lexical_rows, self._dense_rows(embedding)], self.rrf_k)
+        return [
+            self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[row])
+            for row in rows[:self.k]
+        ]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._fuse(query, self.vector_store.embeddings.embed_query(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = await self.vector_store.embeddings.aembed_query(query)
+        # BM25 reads SQLite and FAISS searches synchronously; keep both off the event loop.
+        return await asyncio.to_thread(self._fuse, query, embedding)
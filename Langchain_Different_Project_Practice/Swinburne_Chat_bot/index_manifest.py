@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+MANIFEST_FILE = "sources.sqlite"
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class SourceManifest:
+    """Which vector ids came from which URL, with the page's content hash and fetch time."""
+
+    def __init__(self, entries=None):
+        # url -> {'content_hash': ..., 'fetched_at': ..., 'ids': [...]}
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, folder_path):
+        path = os.path.join(folder_path, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return cls()
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute("SELECT url, content_hash, fetched_at, ids FROM sources").fetchall()
+        finally:
+            conn.close()
+        return cls({
+            url: {'content_hash': digest, 'fetched_at': fetched_at, 'ids': json.loads(ids)}
+            for url, digest, fetched_at, ids in rows
+        })
+
+    def save(self, folder_path):
+        os.makedirs(folder_path, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(folder_path, MANIFEST_FILE))
+        try:
+            conn.execute("DROP TABLE IF EXISTS sources")
+            conn.execute(
+                "CREATE TABLE sources (url TEXT PRIMARY KEY, content_hash TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, ids TEXT NOT NULL)"
+            )
+            conn.executemany(
+                "INSERT INTO sources VALUES (?, ?, ?, ?)",
+                [(url, entry['content_hash'], entry['fetched_at'], json.dumps(entry['ids']))
+                 for url, entry in self.entries.items()]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+class IncrementalUpdate:
+    """Bookkeeping for one ingestion run against an existing index.
+
+    Parse workers call check() to skip pages whose text is unchanged; split
+    workers call expect() with each page's chunk count; the index writer
+    calls record() with the ids it assigned; apply() then deletes the
+    vectors of changed, vanished or pruned pages in place and updates the
+    manifest. A changed page only replaces its old entry once all of its
+    chunks were written, so a page that failed half way keeps its old
+    vectors and hash and is retried by the next run.
+    """
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._new_ids = defaultdict(list)
+        self._expected = {}
+        self._gone = set()
+        # Pages whose indexed content is already current.
+        self._unchanged_urls = set()
+        self.unchanged = 0
+        self.changed = 0
+        self.added = 0
+        self.failed = 0
+
+    def check(self, doc):
+        """Return True if doc is new or changed and should be (re)indexed."""
+        url = doc.metadata['source']
+        digest = content_hash(doc.page_content)
+        entry = self.manifest.entries.get(url)
+        with self._lock:
+            if entry is not None and entry['content_hash'] == digest:
+                self.unchanged += 1
+                self._unchanged_urls.add(url)
+                return False
+            if entry is None:
+                self.added += 1
+            else:
+                self.changed += 1
+            self._pending[url] = (digest, time.time())
+        return True
+
+    def expect(self, url, count):
+        """Record that url was split into count chunks."""
+        with self._lock:
+            self._expected[url] = count
+
+    def completed_urls(self):
+        """The new or changed pages whose chunks have all been written."""
+        with self._lock:
+            return {url for url in self._pending
+                    if url in self._expected and len(self._new_ids.get(url, ())) == self._expected[url]}
+
+    def mark_unchanged(self, url):
+        """Record that url was skipped because its body is the one already indexed."""
+        with self._lock:
+            self._unchanged_urls.add(url)
+
+    def indexed_urls(self):
+        """The pages whose current content is in the index: unchanged ones and completed ones."""
+        completed = self.completed_urls()
+        with self._lock:
+            return completed | self._unchanged_urls
+
+    def is_indexed(self, url):
+        return url in self.manifest.entries
+
+    def mark_gone(self, url):
+        with self._lock:
+            self._gone.add(url)
+
+    def removed_urls(self):
+        """The pages apply() removes: vanished (404/410) or pruned."""
+        with self._lock:
+            return set(self._gone)
+
+    def prune(self, keep_urls):
+        """Schedule removal of every indexed URL not in keep_urls."""
+        keep_urls = set(keep_urls)
+        with self._lock:
+            self._gone.update(url for url in self.manifest.entries if url not in keep_urls)
+
+    def record(self, chunks, ids):
+        with self._lock:
+            for chunk, id_ in zip(chunks, ids):
+                self._new_ids[chunk.metadata['source']].append(id_)
+
+    def apply(self, vector_store):
+        """Drop stale vectors from vector_store and bring the manifest up to date."""
+        entries = self.manifest.entries
+        completed = self.completed_urls()
+        stale_ids = []
+        removed = 0
+        for url in self._gone:
+            if url in entries:
+                stale_ids.extend(entries.pop(url)['ids'])
+                removed += 1
+        for url, (digest, fetched_at) in self._pending.items():
+            if url not in completed:
+                # Drop whatever part of the page did get written; the old entry stays.
+                stale_ids.extend(self._new_ids.get(url, []))
+                self.failed += 1
+                continue
+            if url in entries:
+                stale_ids.extend(entries[url]['ids'])
+            entries[url] = {'content_hash': digest, 'fetched_at': fetched_at, 'ids': self._new_ids.get(url, [])}
+
+        if stale_ids and vector_store is not None:
+            present = set(vector_store.index_to_docstore_id.values())
+            stale_ids = [id_ for id_ in stale_ids if id_ in present]
+            if stale_ids:
+                vector_store.delete(stale_ids)
+
+        print(f"Index update: {self.added} added, {self.changed} changed, {self.unchanged} unchanged, "
+              f"{removed} removed pages, {len(stale_ids)} vectors deleted")
+        if self.failed:
+            print(f"Index update: {self.failed} new or changed pages were not fully indexed and keep their previous state")
@@ -0,0 +1,277 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+from bs4 import BeautifulSoup
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from embedding_batcher import EmbeddingBatcher
+
+_DONE = object()
+
+# Client errors that retrying will not fix; timeouts and rate limits are worth another try.
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+def is_permanent_error(status_code):
+    return 400 <= status_code < 500 and status_code not in RETRYABLE_CLIENT_ERRORS
+
+class IngestionFailed(Exception):
+    """Some items were dropped by a stage; failures maps stage name to how many."""
+
+    def __init__(self, failures):
+        self.failures = dict(failures)
+        # args is what pickling passes back to __init__, e.g. from a shard's worker process.
+        super().__init__(self.failures)
+
+    def __str__(self):
+        return (f"{sum(self.failures.values())} items dropped ("
+                + ", ".join(f"{name} {count}" for name, count in self.failures.items()) + ")")
+
+def parse_html(url, html):
+    """Turn a fetched page into a Document the same way WebBaseLoader does."""
+    soup = BeautifulSoup(html, 'html.parser')
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+class Stage:
+    """A pool of worker threads moving items from one bounded queue to the next.
+
+    func returns an iterable of outputs for each input. Putting to a full
+    outbox blocks, which is what pushes back on the stages upstream. If
+    given, flush is called once the inbox is drained and its outputs are
+    forwarded before the outbox is closed.
+    """
+
+    def __init__(self, name, func, workers, inbox, outbox, flush=None):
+        self.name = name
+        self.func = func
+        self.flush = flush
+        self.inbox = inbox
+        self.outbox = outbox
+        self.processed = 0
+        self.failed = 0
+        self._running = workers
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                # Let sibling workers see the sentinel too; the last one out closes the outbox.
+                self.inbox.put(_DONE)
+                break
+            try:
+                outputs = self.func(item)
+            except Exception as e:
+                print(f"[{self.name}] Error: {e}")
+                with self._lock:
+                    self.failed += 1
+                continue
+            for output in outputs:
+                self.outbox.put(output)
+            with self._lock:
+                self.processed += 1
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            if self.flush is not None:
+                for output in self.flush():
+                    self.outbox.put(output)
+            self.outbox.put(_DONE)
+
+class IngestionPipeline:
+    """fetch -> parse -> split -> pack -> embed -> index, each stage with its own workers and queue."""
+
+    def __init__(self, embedder, splitter=None, fetch_workers=16, parse_workers=4,
+                 parse_processes=0, split_workers=2, embed_workers=4, queue_size=64,
+                 timeout=30, user_agent=None, batcher=None, update=None,
+                 crawl_state=None, conditional=False):
+        self.embedder = embedder
+        self.batcher = batcher or EmbeddingBatcher(embedder)
+        # An index_manifest.IncrementalUpdate; skips unchanged pages and records vector ids.
+        self.update = update
+        # A crawl_state.CrawlState; with conditional=True unchanged pages are not re-downloaded.
+        self.crawl_state = crawl_state
+        self.conditional = conditional
+        self.splitter = splitter or RecursiveCharacterTextSplitter()
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.parse_processes = parse_processes
+        self.split_workers = split_workers
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.user_agent = user_agent or os.getenv('USER_AGENT')
+        self._local = threading.local()
+        self._parse_executor = None
+        self.stages = []
+        # url -> HTTP status (or error) of pages that can never be fetched; not counted as failures.
+        self.skipped = {}
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            if self.user_agent:
+                session.headers['User-Agent'] = self.user_agent
+            self._local.session = session
+        return session
+
+    def fetch(self, url):
+        state = None
+        headers = None
+        # Only a page that is in the index may be skipped as unchanged; one that
+        # was removed (e.g. after a 404) and came back must be indexed again.
+        skippable = self.conditional and (self.update is None or self.update.is_indexed(url))
+        if self.crawl_state is not None:
+            state = self.crawl_state.get(url)
+            if skippable:
+                if self.crawl_state.is_unchanged_in_sitemap(state):
+                    return []
+                headers = self.crawl_state.conditional_headers(state)
+
+        try:
+            response = self._session().get(url, timeout=self.timeout, headers=headers)
+        except (requests.exceptions.InvalidURL, requests.exceptions.MissingSchema,
+                requests.exceptions.InvalidSchema) as e:
+            return self._skip(url, type(e).__name__)
+        if response.status_code == 304 and self.crawl_state is not None:
+            self.crawl_state.mark_not_modified()
+            return []
+        if is_permanent_error(response.status_code):
+            return self._skip(url, response.status_code)
+        response.raise_for_status()
+
+        if self.crawl_state is not None:
+            changed = self.crawl_state.record(url, state, response, response.content)
+            if skippable and not changed:
+                if self.update is not None:
+                    self.update.mark_unchanged(url)
+                return []
+        return [(url, response.text)]
+
+    def parse(self, page):
+        url, html = page
+        if self._parse_executor is not None:
+            doc = self._parse_executor.submit(parse_html, url, html).result()
+        else:
+            doc = parse_html(url, html)
+        if self.update is not None and not self.update.check(doc):
+            return []
+        return [doc]
+
+    def split(self, doc):
+        chunks = self.splitter.split_documents([doc])
+        if self.update is not None:
+            self.update.expect(doc.metadata['source'], len(chunks))
+        return [chunks] if chunks else []
+
+    def embed(self, batch):
+        return [(batch.chunks, self.batcher.embed(batch))]
+
+    def _build_stages(self):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(6)]
+        stage_specs = [
+            ('fetch', self.fetch, self.fetch_workers, None),
+            ('parse', self.parse, self.parse_workers, None),
+            ('split', self.split, self.split_workers, None),
+            ('pack', self.batcher.pack, 1, self.batcher.flush),
+            ('embed', self.embed, self.embed_workers, None),
+        ]
+        self.stages = [
+            Stage(name, func, workers, queues[i], queues[i + 1], flush)
+            for i, (name, func, workers, flush) in enumerate(stage_specs)
+        ]
+        return queues[0], queues[-1]
+
+    def _skip(self, url, reason):
+        """Drop a page that cannot be fetched; like a vanished one, it leaves the index."""
+        self.skipped[url] = reason
+        if self.update is not None:
+            self.update.mark_gone(url)
+        return []
+
+    def _feed(self, urls, inbox):
+        for url in urls:
+            inbox.put(url)
+        inbox.put(_DONE)
+
+    def _index(self, outbox, vector_store):
+        """Single writer: FAISS indexes are not safe to add to from several threads."""
+        while True:
+            item = outbox.get()
+            if item is _DONE:
+                return vector_store
+            chunks, vectors = item
+            text_embeddings = [(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)]
+            metadatas = [chunk.metadata for chunk in chunks]
+            ids = [str(uuid.uuid4()) for _ in chunks]
+            if vector_store is None:
+                vector_store = FAISS.from_embeddings(text_embeddings, self.embedder, metadatas=metadatas, ids=ids)
+            else:
+                vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            if self.update is not None:
+                self.update.record(chunks, ids)
+
+    def run(self, urls, vector_store=None):
+        """Ingest urls into vector_store (a new one if None).
+
+        Returns (vector_store, failures), where failures maps each stage that
+        dropped items to how many it dropped. Pages that fail with a permanent
+        client error (e.g. 403, 404) are not failures; see self.skipped.
+        """
+        start = time.perf_counter()
+        if self.parse_processes:
+            self._parse_executor = ProcessPoolExecutor(self.parse_processes)
+        try:
+            inbox, outbox = self._build_stages()
+            for stage in self.stages:
+                stage.start()
+            feeder = threading.Thread(target=self._feed, args=(urls, inbox), daemon=True)
+            feeder.start()
+            vector_store = self._index(outbox, vector_store)
+            feeder.join()
+            for stage in self.stages:
+                stage.join()
+        finally:
+            if self._parse_executor is not None:
+                self._parse_executor.shutdown()
+                self._parse_executor = None
+
+        elapsed = time.perf_counter() - start
+        for stage in self.stages:
+            print(f"{stage.name}: {stage.processed} ok, {stage.failed} failed")
+        fetched = self.stages[0].processed + self.stages[0].failed
+        print(f"Ingested {fetched} urls in {elapsed:.1f}s")
+        if self.skipped:
+            print(f"Skipped {len(self.skipped)} urls that cannot be fetched:")
+            for url, reason in sorted(self.skipped.items()):
+                print(f"  {reason} {url}")
+        self.batcher.report(elapsed)
+        failures = {stage.name: stage.failed for stage in self.stages if stage.failed}
+        return vector_store, failures
@@ -0,0 +1,104 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+LEXICAL_FILE = "lexical.sqlite"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its my of on or that the this "
+    "to was what when where which who will with you your".split()
+)
+# One posting: the FAISS row the chunk is stored at and the term's count in it.
+_POSTING = np.dtype([('row', '<u4'), ('tf', '<u2')])
+
+def tokenize(text):
+    """Lowercased alphanumeric runs, so unit codes like COS10009 stay one term."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+def has_lexical_index(folder_path):
+    return os.path.exists(os.path.join(folder_path, LEXICAL_FILE))
+
+def build_lexical_index(vector_store, folder_path):
+    """Write a BM25 inverted index over every chunk in vector_store to folder_path.
+
+    Postings refer to FAISS rows, so the index must be rebuilt whenever the
+    vector store is saved; rows keep their order through save_mmap_store.
+    """
+    postings = defaultdict(list)
+    lengths = np.zeros(vector_store.index.ntotal, dtype=np.uint32)
+    for row in range(vector_store.index.ntotal):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[row])
+        tokens = tokenize(doc.page_content)
+        lengths[row] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            postings[term].append((row, min(tf, 0xFFFF)))
+
+    path = os.path.join(folder_path, LEXICAL_FILE)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE terms (term TEXT PRIMARY KEY, postings BLOB NOT NULL) WITHOUT ROWID")
+        conn.execute("CREATE TABLE doc_lengths (lengths BLOB NOT NULL)")
+        conn.executemany(
+            "INSERT INTO terms VALUES (?, ?)",
+            ((term, np.array(rows, dtype=_POSTING).tobytes()) for term, rows in postings.items())
+        )
+        conn.execute("INSERT INTO doc_lengths VALUES (?)", (lengths.tobytes(),))
+        conn.commit()
+    finally:
+        conn.close()
+    # Swap the finished file in, so a running app never reads a half-written index.
+    os.replace(tmp_path, path)
+    print(f"Lexical index: {len(postings)} terms over {len(lengths)} chunks "
+          f"({os.path.getsize(path) / 1024 ** 2:.1f} MiB)")
+
+class LexicalIndex:
+    """Read-only BM25 search over a folder's lexical.sqlite."""
+
+    def __init__(self, folder_path, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        path = os.path.join(folder_path, LEXICAL_FILE)
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        blob, = self._conn.execute("SELECT lengths FROM doc_lengths").fetchone()
+        self.lengths = np.frombuffer(blob, dtype=np.uint32)
+        self.size = len(self.lengths)
+        self.avg_length = float(self.lengths.mean()) if self.size else 0.0
+
+    def search(self, query, k=20):
+        """Return up to k (row, score) pairs, best first."""
+        terms = sorted(set(tokenize(query)))
+        if not terms or not self.size:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT postings FROM terms WHERE term IN ({','.join('?' * len(terms))})", terms
+            ).fetchall()
+        all_rows = []
+        all_scores = []
+        for blob, in rows:
+            postings = np.frombuffer(blob, dtype=_POSTING)
+            df = len(postings)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            tf = postings['tf'].astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[postings['row']] / self.avg_length)
+            all_rows.append(postings['row'])
+            all_scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not all_rows:
+            return []
+        matched, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        top = np.argsort(-scores)[:k]
+        return [(int(matched[i]), float(scores[i])) for i in top]
+
+    def close(self):
+        self._conn.close()
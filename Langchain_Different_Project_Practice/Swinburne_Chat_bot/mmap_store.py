@@ -0,0 +1,207 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain_core.documents import Document
+from ann_index import ANN_CONFIG_FILE, ANN_FILE, ANN_VECTORS_FILE
+from lexical_index import LEXICAL_FILE
+from sentence_store import SENTENCE_FILE
+
+INDEX_FILE = "index.faiss"
+# The flat index as raw float32 rows; separate from a quantized index's ann_vectors.f32.
+VECTORS_FILE = "vectors.f32"
+DOCS_FILE = "docs.bin"
+OFFSETS_FILE = "docs.idx"
+
+_OFFSET = struct.Struct("<Q")
+
+def is_mmap_store(folder_path):
+    """Return True if the folder holds an index saved by save_mmap_store."""
+    return os.path.exists(os.path.join(folder_path, OFFSETS_FILE))
+
+def save_mmap_store(vector_store, folder_path):
+    """Save a FAISS vector store as a raw index plus an offset-indexed document file.
+
+    An L2 flat index is also written as raw float32 rows to vectors.f32,
+    which load_mmap_store maps instead of reading the index.
+    """
+    faiss = dependable_faiss_import()
+    os.makedirs(folder_path, exist_ok=True)
+    faiss.write_index(vector_store.index, os.path.join(folder_path, INDEX_FILE))
+    vectors_path = os.path.join(folder_path, VECTORS_FILE)
+    if isinstance(vector_store.index, faiss.IndexFlatL2) and vector_store.index.ntotal:
+        vector_store.index.reconstruct_n(0, vector_store.index.ntotal).astype(np.float32).tofile(vectors_path)
+    elif os.path.exists(vectors_path):
+        os.remove(vectors_path)
+
+    offset = 0
+    with open(os.path.join(folder_path, DOCS_FILE), 'wb') as docs_file, \
+            open(os.path.join(folder_path, OFFSETS_FILE), 'wb') as offsets_file:
+        offsets_file.write(_OFFSET.pack(offset))
+        for i in range(vector_store.index.ntotal):
+            doc_id = vector_store.index_to_docstore_id[i]
+            doc = vector_store.docstore.search(doc_id)
+            record = json.dumps({
+                'id': doc_id,
+                'page_content': doc.page_content,
+                'metadata': doc.metadata
+            }).encode('utf-8')
+            docs_file.write(record)
+            offset += len(record)
+            offsets_file.write(_OFFSET.pack(offset))
+
+class PositionalIds(Mapping):
+    """index_to_docstore_id for an mmap store: row i is stored under id str(i)."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < self.size:
+            raise KeyError(i)
+        return str(i)
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+class MmapDocstore(Docstore):
+    """Read-only docstore that decodes documents straight out of a memory-mapped file."""
+
+    def __init__(self, folder_path):
+        self._docs = self._map(os.path.join(folder_path, DOCS_FILE))
+        self._offsets = self._map(os.path.join(folder_path, OFFSETS_FILE))
+        self.size = len(self._offsets) // _OFFSET.size - 1
+
+    @staticmethod
+    def _map(path):
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_record(self, position):
+        start, = _OFFSET.unpack_from(self._offsets, position * _OFFSET.size)
+        end, = _OFFSET.unpack_from(self._offsets, (position + 1) * _OFFSET.size)
+        return json.loads(self._docs[start:end].decode('utf-8'))
+
+    def search(self, search):
+        position = int(search)
+        if not 0 <= position < self.size:
+            return f"ID {search} not found."
+        record = self.get_record(position)
+        return Document(page_content=record['page_content'], metadata=record['metadata'])
+
+class MmapFlatIndex:
+    """Exact L2 search over float32 rows memory-mapped from vectors.f32.
+
+    faiss 1.8 reads flat codes into each process's heap even with
+    IO_FLAG_MMAP; these rows live in the page cache, shared by every
+    worker on the host. Provides the part of the faiss index API the
+    langchain FAISS store uses: search, reconstruct, ntotal and d.
+    """
+
+    def __init__(self, vectors, block_size=65536):
+        self.vectors = vectors
+        self.block_size = block_size
+        self._norms = None
+        self._lock = threading.Lock()
+
+    @property
+    def norms(self):
+        """Squared row norms, 4 bytes per vector of private memory. Computed on the first
+        search, so a store only searched through an ANN index never reads every row."""
+        with self._lock:
+            if self._norms is None:
+                vectors, block_size = self.vectors, self.block_size
+                self._norms = np.concatenate([
+                    np.einsum('ij,ij->i', block, block)
+                    for block in (vectors[start:start + block_size] for start in range(0, len(vectors), block_size))
+                ]) if len(vectors) else np.zeros(0, dtype=np.float32)
+            return self._norms
+
+    @property
+    def ntotal(self):
+        return len(self.vectors)
+
+    @property
+    def d(self):
+        return self.vectors.shape[1]
+
+    def search(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float32)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        query_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+        norms = self.norms
+        for start in range(0, self.ntotal, self.block_size):
+            block = self.vectors[start:start + self.block_size]
+            block_distances = norms[start:start + len(block)] - 2 * queries @ block.T + query_norms
+            rows = np.broadcast_to(np.arange(start, start + len(block)), block_distances.shape)
+            # Merge the block's candidates with the best k so far.
+            merged_distances = np.concatenate([distances, block_distances], axis=1)
+            merged_labels = np.concatenate([labels, rows], axis=1)
+            top = np.argsort(merged_distances, axis=1, kind='stable')[:, :k]
+            distances = np.take_along_axis(merged_distances, top, axis=1)
+            labels = np.take_along_axis(merged_labels, top, axis=1)
+        labels[np.isinf(distances)] = -1
+        return np.maximum(distances, 0), labels
+
+    def reconstruct(self, i):
+        return np.array(self.vectors[i])
+
+def load_mmap_store(folder_path, embeddings):
+    """Load a store saved by save_mmap_store without copying vectors or documents into the heap."""
+    faiss = dependable_faiss_import()
+    docstore = MmapDocstore(folder_path)
+    vectors_path = os.path.join(folder_path, VECTORS_FILE)
+    if docstore.size and os.path.exists(vectors_path):
+        vectors = np.memmap(vectors_path, dtype=np.float32, mode='r')
+        return FAISS(embeddings, MmapFlatIndex(vectors.reshape(docstore.size, -1)), docstore,
+                     PositionalIds(docstore.size))
+    if not hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+        # IO_FLAG_MMAP only maps IVF lists; flat codes are read into this process's heap.
+        print(f"{folder_path}: no {VECTORS_FILE} and this faiss lacks IO_FLAG_MMAP_IFC; "
+              f"flat vectors are not shared between processes (re-run mmap_store.py to fix)")
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(os.path.join(folder_path, INDEX_FILE), flags)
+    if docstore.size != index.ntotal:
+        raise ValueError(f"{folder_path}: index has {index.ntotal} vectors but {docstore.size} documents")
+    return FAISS(embeddings, index, docstore, PositionalIds(index.ntotal))
+
+def convert(source_path, target_path):
+    """Convert a FAISS.save_local directory into the mmap format."""
+    from langchain_openai import OpenAIEmbeddings
+
+    vector_store = FAISS.load_local(
+        source_path,
+        OpenAIEmbeddings(),
+        index_name="index",
+        allow_dangerous_deserialization=True
+    )
+    save_mmap_store(vector_store, target_path)
+    # Rows keep their order, so the BM25 and ANN indexes, and a quantized index's re-rank
+    # vectors, stay valid for the converted store. Sentence vectors don't depend on rows.
+    for name in (LEXICAL_FILE, ANN_FILE, ANN_CONFIG_FILE, ANN_VECTORS_FILE, SENTENCE_FILE):
+        if os.path.exists(os.path.join(source_path, name)):
+            shutil.copy2(os.path.join(source_path, name), os.path.join(target_path, name))
+    print(f"Converted {vector_store.index.ntotal} vectors: {source_path} -> {target_path}")
+
+if __name__ == "__main__":
+    load_dotenv()
+    if len(sys.argv) != 3:
+        print("Usage: python mmap_store.py <save_local dir> <mmap dir>")
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
@@ -0,0 +1,160 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import time
+import warnings
+
+import numpy as np
+from dotenv import load_dotenv
+
+from ann_index import load_ann_config
+from app import VectorDB
+from create_vector_store import get_embedder
+from lexical_index import has_lexical_index
+
+SEARCH_TYPES = ('mmr', 'similarity', 'similarity_score_threshold', 'hybrid')
+
+def load_questions(path):
+    """JSONL of {"query": ..., "url": ...} or {"query": ..., "urls": [...]}: the pages that answer each query."""
+    questions = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                question = json.loads(line)
+                questions.append({'query': question['query'],
+                                  'urls': question.get('urls') or [question['url']]})
+    return questions
+
+def synthetic_questions(vector_store, count, seed=0):
+    """Use one sentence of randomly chosen chunks as the query for that chunk's page."""
+    rng = random.Random(seed)
+    rows = rng.sample(range(vector_store.index.ntotal), min(count, vector_store.index.ntotal))
+    questions = []
+    for row in rows:
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[row])
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", doc.page_content) if len(s.split()) >= 4]
+        if sentences:
+            questions.append({'query': rng.choice(sentences)[:300], 'urls': [doc.metadata.get('source')]})
+    return questions
+
+def evaluate(retriever, questions):
+    """recall@k, MRR and search latency percentiles of retriever over questions."""
+    latencies = []
+    hits = 0
+    reciprocal_ranks = 0.0
+    returned = 0
+    for question in questions:
+        start = time.perf_counter()
+        docs = retriever.invoke(question['query'])
+        latencies.append((time.perf_counter() - start) * 1000)
+        returned += len(docs)
+        sources = [doc.metadata.get('source') for doc in docs]
+        rank = next((i for i, source in enumerate(sources, start=1) if source in question['urls']), None)
+        if rank is not None:
+            hits += 1
+            reciprocal_ranks += 1.0 / rank
+    return {
+        'recall': hits / len(questions),
+        'mrr': reciprocal_ranks / len(questions),
+        'avg_docs': returned / len(questions),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+def configurations(search_types, ks, fetch_ks, thresholds):
+    """Every combination that changes behaviour: fetch_k only matters to mmr and hybrid,
+    score_threshold only to similarity_score_threshold."""
+    for search_type, k in itertools.product(search_types, ks):
+        if search_type in ('mmr', 'hybrid'):
+            for fetch_k in fetch_ks:
+                if fetch_k >= k:
+                    yield {'search_type': search_type, 'k': k, 'fetch_k': fetch_k}
+        elif search_type == 'similarity_score_threshold':
+            for threshold in thresholds:
+                yield {'search_type': search_type, 'k': k, 'score_threshold': threshold}
+        else:
+            yield {'search_type': search_type, 'k': k}
+
+def describe_index(vector_db):
+    """What was benchmarked, so results from different builds can be told apart."""
+    path = vector_db.vector_path
+    return {
+        'path': os.path.abspath(path),
+        'vectors': vector_db.vector_store.index.ntotal,
+        # VectorDB wraps the loaded index in a TracedIndex.
+        'index_class': type(vector_db.vector_store.index.index).__name__,
+        'ann': load_ann_config(path),
+        'lexical': has_lexical_index(path),
+        'modified_at': max(os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)),
+    }
+
+def parse_list(kind):
+    return lambda text: [kind(value) for value in text.split(',') if value]
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Sweep VectorDB retriever settings over labeled questions.")
+    parser.add_argument('--index', default='Swinburne_Chat_Bot')
+    parser.add_argument('--questions', help="JSONL of query/url(s) (default: synthetic questions from the index)")
+    parser.add_argument('--synthetic', type=int, default=200, help="synthetic questions to sample")
+    parser.add_argument('--search-types', type=parse_list(str), default=list(SEARCH_TYPES))
+    parser.add_argument('--k', type=parse_list(int), default=[1, 2, 4])
+    parser.add_argument('--fetch-k', type=parse_list(int), default=[10, 20, 50])
+    parser.add_argument('--thresholds', type=parse_list(float), default=[0.0, 0.1, 0.3, 0.5])
+    parser.add_argument('--embedding-cache', default='query_embedding_cache.sqlite',
+                        help="on-disk query embedding cache; once filled, reruns make no embedding calls")
+    parser.add_argument('--fake-embeddings', type=int, metavar='DIM')
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # langchain warns on every query whose relevance scores fall outside [0, 1] or under the threshold.
+    warnings.filterwarnings('ignore', message="Relevance scores must be between")
+    logging.getLogger('langchain_core.vectorstores.base').setLevel(logging.ERROR)
+
+    unknown = set(args.search_types) - set(SEARCH_TYPES)
+    if unknown:
+        parser.error(f"unknown search types {sorted(unknown)}; expected {SEARCH_TYPES}")
+    vector_db = VectorDB(args.index, embedder=get_embedder(args.fake_embeddings),
+                         query_cache_path=args.embedding_cache or None,
+                         retriever_mode='hybrid' if has_lexical_index(args.index) else 'mmr')
+    search_types = args.search_types
+    if 'hybrid' in search_types and vector_db.retriever_mode != 'hybrid':
+        print(f"{args.index} has no lexical index; skipping hybrid")
+        search_types = [t for t in search_types if t != 'hybrid']
+    questions = (load_questions(args.questions) if args.questions
+                 else synthetic_questions(vector_db.vector_store, args.synthetic))
+
+    # Embed every question once up front, so the sweep times search alone.
+    start = time.perf_counter()
+    for question in questions:
+        vector_db.embedder.embed_query(question['query'])
+    print(f"Embedded {len(questions)} questions in {time.perf_counter() - start:.1f}s "
+          f"({vector_db.embedder.stats()})")
+
+    results = []
+    for config in configurations(search_types, args.k, args.fetch_k, args.thresholds):
+        retriever = vector_db.get_retriever(**config)
+        result = {**config, **evaluate(retriever, questions)}
+        results.append(result)
+        settings = ' '.join(f"{key}={value}" for key, value in config.items())
+        print(f"{settings:<62} recall@k {result['recall']:.3f}  MRR {result['mrr']:.3f}  "
+              f"p50 {result['p50_ms']:.2f}  p95 {result['p95_ms']:.2f}  p99 {result['p99_ms']:.2f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'created_at': time.time(),
+                'index': describe_index(vector_db),
+                'questions': args.questions or f"synthetic:{len(questions)}",
+                'question_count': len(questions),
+                'results': results,
+            }, file, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
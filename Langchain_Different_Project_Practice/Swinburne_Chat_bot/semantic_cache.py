@@ -0,0 +1,83 @@
+import threading
+import time
+
+import numpy as np
+
+class SemanticCache:
+    """Answers keyed by query embedding, served again for any query whose
+    cosine similarity to a cached one is at least `threshold`.
+
+    Entries expire after `ttl` seconds; invalidate() drops everything and
+    is called whenever the underlying index is reloaded.
+    """
+
+    def __init__(self, embedder, threshold=0.95, ttl=24 * 3600, max_entries=2000):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._entries = []
+        self.lookups = 0
+        self.hits = 0
+
+    def embed(self, query):
+        return self._normalize(self.embedder.embed_query(query))
+
+    async def aembed(self, query):
+        return self._normalize(await self.embedder.aembed_query(query))
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector):
+        """Return the cached answer closest to vector, or None."""
+        with self._lock:
+            self.lookups += 1
+            self._expire()
+            if not self._entries:
+                return None
+            similarities = self._vectors @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            self.hits += 1
+            return self._entries[best]['answer']
+
+    def store(self, vector, query, answer):
+        with self._lock:
+            self._entries.append({'query': query, 'answer': answer, 'created_at': time.time()})
+            row = vector[np.newaxis, :]
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            if len(self._entries) > self.max_entries:
+                self._keep(slice(len(self._entries) - self.max_entries, None))
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        # Entries are appended in creation order, so expired ones form a prefix.
+        fresh = next((i for i, entry in enumerate(self._entries) if entry['created_at'] >= cutoff),
+                     len(self._entries))
+        if fresh:
+            self._keep(slice(fresh, None))
+
+    def _keep(self, rows):
+        self._entries = self._entries[rows]
+        self._vectors = self._vectors[rows] if self._entries else None
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = []
+            self._vectors = None
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+            'llm_calls_saved': self.hits,
+        }
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from embedding_cache import embedder_name, normalize_text
+
+SENTENCE_FILE = "sentences.sqlite"
+
+# Sentence ends, and the line breaks that separate menu items and headings on scraped pages.
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_BREAK.split(text) if sentence.strip()]
+
+def sentence_key(sentence):
+    return hashlib.sha256(normalize_text(sentence).encode('utf-8')).hexdigest()
+
+def has_sentence_store(folder_path):
+    return os.path.exists(os.path.join(folder_path, SENTENCE_FILE))
+
+def build_sentence_store(vector_store, folder_path, batcher):
+    """Write a vector for every sentence of every chunk in vector_store to folder_path.
+
+    These are what CONTEXT_COMPRESSION=embedding scores sentences with. The
+    file is rewritten whole, like the lexical index, so it holds exactly
+    the current chunks' sentences and nothing is ever evicted. Vectors from
+    the previous file are reused; the rest are embedded through batcher (and
+    its cache). Returns how many sentences could not be embedded.
+    """
+    sentences = sorted({sentence for doc_id in vector_store.index_to_docstore_id.values()
+                        for sentence in split_sentences(vector_store.docstore.search(doc_id).page_content)})
+    model_name = embedder_name(batcher.embedder)
+    vectors = {}
+    if has_sentence_store(folder_path):
+        previous = SentenceStore(folder_path)
+        if previous.model_name == model_name:
+            vectors = {sentence: vector for sentence, vector in zip(sentences, previous.get_many(sentences))
+                       if vector is not None}
+        previous.close()
+    reused = len(vectors)
+
+    missing = [Document(page_content=sentence) for sentence in sentences if sentence not in vectors]
+    failed = 0
+    for batch in batcher.pack(missing) + batcher.flush():
+        try:
+            batch_vectors = batcher.embed(batch)
+        except Exception as e:
+            print(f"[sentences] Error: {e}")
+            failed += len(batch.chunks)
+            continue
+        for chunk, vector in zip(batch.chunks, batch_vectors):
+            vectors[chunk.page_content] = vector
+
+    path = os.path.join(folder_path, SENTENCE_FILE)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE meta (model TEXT NOT NULL)")
+        conn.execute("CREATE TABLE sentences (key TEXT PRIMARY KEY, vector BLOB NOT NULL) WITHOUT ROWID")
+        conn.execute("INSERT INTO meta VALUES (?)", (model_name,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO sentences VALUES (?, ?)",
+            ((sentence_key(sentence), np.asarray(vector, dtype=np.float32).tobytes())
+             for sentence, vector in vectors.items())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    # Swap the finished file in, so a running app never reads a half-written store.
+    os.replace(tmp_path, path)
+    print(f"Sentence store: {len(vectors)} of {len(sentences)} sentences "
+          f"({reused} reused, {len(vectors) - reused} new)")
+    return failed
+
+class SentenceStore:
+    """The sentence vectors saved next to an index, opened read-only: lookups never write."""
+
+    def __init__(self, folder_path):
+        path = os.path.abspath(os.path.join(folder_path, SENTENCE_FILE))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.model_name = self._conn.execute("SELECT model FROM meta").fetchone()[0]
+
+    def get_many(self, sentences):
+        """Return a vector or None for each sentence, in order."""
+        keys = [sentence_key(sentence) for sentence in sentences]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM sentences WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return [found.get(key) for key in keys]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
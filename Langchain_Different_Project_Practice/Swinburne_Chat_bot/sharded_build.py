@@ -0,0 +1,144 @@
+import os
+import pickle
+import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
+from index_manifest import SourceManifest
+from ingest_pipeline import IngestionFailed
+
+DONE_FILE = "DONE"
+
+def split_shards(count, shards):
+    """Split range(count) into `shards` contiguous (start, end) ranges of near-equal size."""
+    shards = max(1, min(shards, count))
+    size, extra = divmod(count, shards)
+    ranges = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def is_done(path):
+    return os.path.exists(os.path.join(path, DONE_FILE))
+
+def mark_done(path):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, DONE_FILE), 'w') as file:
+        file.write("ok\n")
+
+def has_index(path):
+    return os.path.exists(os.path.join(path, "index.faiss"))
+
+def build_shard(build_index, args, urls, shard_dir):
+    """Build one shard; a shard that dropped items is not marked DONE, so a rerun rebuilds it.
+
+    Pages that fail permanently (e.g. 404, 403) are skipped rather than
+    dropped, so one broken URL does not keep its shard from finishing.
+    """
+    if is_done(shard_dir):
+        print(f"{shard_dir}: already built, skipping")
+        return shard_dir
+    # A crashed attempt may have left a partial index behind.
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    build_index(args, urls, shard_dir)
+    mark_done(shard_dir)
+    return shard_dir
+
+def load_parts(path):
+    """Read a save_local directory as (faiss index, docstore, index_to_docstore_id).
+
+    Merging needs no embedder, and the OpenAI one cannot be pickled into a
+    worker process, so shards are merged from the files directly.
+    """
+    faiss = dependable_faiss_import()
+    index = faiss.read_index(os.path.join(path, "index.faiss"))
+    with open(os.path.join(path, "index.pkl"), 'rb') as file:
+        docstore, index_to_docstore_id = pickle.load(file)
+    return index, docstore, index_to_docstore_id
+
+def save_parts(path, index, docstore, index_to_docstore_id):
+    """Write the files FAISS.save_local would."""
+    faiss = dependable_faiss_import()
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(index, os.path.join(path, "index.faiss"))
+    with open(os.path.join(path, "index.pkl"), 'wb') as file:
+        pickle.dump((docstore, index_to_docstore_id), file)
+
+def merge_pair(left_dir, right_dir, merged_dir):
+    """Merge two built indexes (either may be empty) into merged_dir."""
+    if is_done(merged_dir):
+        return merged_dir
+    shutil.rmtree(merged_dir, ignore_errors=True)
+    parts = [path for path in (left_dir, right_dir) if has_index(path)]
+    if parts:
+        index, docstore, index_to_docstore_id = load_parts(parts[0])
+        manifest = SourceManifest.load(parts[0])
+        for path in parts[1:]:
+            # Same bookkeeping as FAISS.merge_from: the other rows follow ours.
+            other_index, other_docstore, other_ids = load_parts(path)
+            offset = index.ntotal
+            index.merge_from(other_index)
+            docstore.add({doc_id: other_docstore.search(doc_id) for doc_id in other_ids.values()})
+            index_to_docstore_id.update({offset + i: doc_id for i, doc_id in other_ids.items()})
+            manifest.entries.update(SourceManifest.load(path).entries)
+        save_parts(merged_dir, index, docstore, index_to_docstore_id)
+        manifest.save(merged_dir)
+    mark_done(merged_dir)
+    return merged_dir
+
+def run_sharded_build(urls, args, build_index, build_search_indexes, embedder):
+    """Build args.shards shards of urls in parallel, then merge them pairwise into args.output.
+
+    Every shard and intermediate merge lives under <output>-shards and is
+    marked DONE once saved, so rerunning the same command after a crash
+    only redoes the unfinished work. If any shard dropped items (a crash or
+    a transient fetch error), nothing is merged and IngestionFailed is raised
+    once every shard has finished. URLs that can never be fetched are listed
+    by their shard and left out of the merge instead.
+    """
+    work_dir = f"{args.output}-shards"
+    ranges = split_shards(len(urls), args.shards)
+    level = [os.path.join(work_dir, f"shard-{start}-{end}") for start, end in ranges]
+
+    with ProcessPoolExecutor(args.jobs) as executor:
+        futures = [
+            executor.submit(build_shard, build_index, args, urls[start:end], shard_dir)
+            for (start, end), shard_dir in zip(ranges, level)
+        ]
+        level = []
+        failures = Counter()
+        for future in futures:
+            try:
+                level.append(future.result())
+            except IngestionFailed as e:
+                failures.update(e.failures)
+        if failures:
+            raise IngestionFailed(failures)
+
+        depth = 0
+        while len(level) > 1:
+            depth += 1
+            futures = []
+            for i in range(0, len(level) - 1, 2):
+                merged_dir = os.path.join(work_dir, f"merge-{depth}-{i // 2}")
+                futures.append(executor.submit(merge_pair, level[i], level[i + 1], merged_dir))
+            carried = [level[-1]] if len(level) % 2 else []
+            level = [future.result() for future in futures] + carried
+            print(f"Merge level {depth}: {len(level)} indexes left")
+
+    if not has_index(level[0]):
+        print("No documents were ingested")
+        return
+    shutil.rmtree(args.output, ignore_errors=True)
+    shutil.copytree(level[0], args.output, ignore=shutil.ignore_patterns(DONE_FILE))
+    shutil.rmtree(work_dir)
+    # Shards skip the lexical, ANN and sentence indexes; build them once over the merged store.
+    failures = build_search_indexes(FAISS.load_local(args.output, embedder, index_name="index",
+                                                     allow_dangerous_deserialization=True), args.output, args)
+    print(f"Merged {len(ranges)} shards into {args.output}")
+    if failures:
+        raise IngestionFailed(failures)
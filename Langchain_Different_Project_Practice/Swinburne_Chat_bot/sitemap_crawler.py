@@ -0,0 +1,87 @@
+import asyncio
+import os
+import xml.etree.ElementTree as ET
+
+import aiohttp
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def parse_sitemap_xml(content):
+    """Return ([(page url, lastmod)], [child sitemap url]) from a sitemap or sitemap index."""
+    root = ET.fromstring(content)
+    pages = []
+    sitemaps = []
+    for entry in root:
+        kind = _local_name(entry.tag)
+        if kind not in ('url', 'sitemap'):
+            continue
+        fields = {_local_name(child.tag): (child.text or '').strip() for child in entry}
+        loc = fields.get('loc')
+        if not loc:
+            continue
+        if kind == 'url':
+            pages.append((loc, fields.get('lastmod')))
+        else:
+            sitemaps.append(loc)
+    return pages, sitemaps
+
+class SitemapCrawler:
+    """Walks nested sitemap indexes concurrently over one pooled keep-alive session.
+
+    Every sitemap location is fetched at most once, which also breaks
+    cycles between indexes. Page URLs are de-duplicated and kept in the
+    order they were found; their <lastmod> values end up in self.lastmod.
+    """
+
+    def __init__(self, per_host_limit=8, total_limit=64, timeout=30, user_agent=None):
+        self.per_host_limit = per_host_limit
+        self.total_limit = total_limit
+        self.timeout = timeout
+        self.user_agent = user_agent or os.getenv('USER_AGENT')
+        self.urls = []
+        self.lastmod = {}
+        self.failed = []
+        self._seen_sitemaps = set()
+
+    async def crawl(self, sitemap_urls):
+        connector = aiohttp.TCPConnector(limit=self.total_limit, limit_per_host=self.per_host_limit)
+        headers = {'User-Agent': self.user_agent} if self.user_agent else None
+        async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            async with asyncio.TaskGroup() as group:
+                for url in sitemap_urls:
+                    self._schedule(group, session, url)
+        return self.urls
+
+    def _schedule(self, group, session, url):
+        if url in self._seen_sitemaps:
+            return
+        self._seen_sitemaps.add(url)
+        group.create_task(self._crawl_one(group, session, url))
+
+    async def _crawl_one(self, group, session, url):
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    print(f"Failed to retrieve {url}")
+                    self.failed.append(url)
+                    return
+                content = await response.read()
+            pages, sitemaps = parse_sitemap_xml(content)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ET.ParseError) as e:
+            print(f"Failed to retrieve {url}: {e}")
+            self.failed.append(url)
+            return
+
+        for loc, lastmod in pages:
+            if loc not in self.lastmod:
+                self.urls.append(loc)
+                self.lastmod[loc] = lastmod
+        for loc in sitemaps:
+            self._schedule(group, session, loc)
+
+def crawl_sitemaps(sitemap_urls, **options):
+    """Synchronous wrapper: return every page URL reachable from sitemap_urls."""
+    crawler = SitemapCrawler(**options)
+    return asyncio.run(crawler.crawl(sitemap_urls))
@@ -1,12 +1,27 @@
 import requests
 from bs4 import BeautifulSoup
 import os
+from crawl_state import CrawlState
 
-def fetch_html(url):
-    """Fetch HTML content from a given URL."""
+def fetch_html(url, crawl_state=None):
+    """Fetch HTML content from a given URL.
+
+    With a CrawlState, send a conditional request and return None if the
+    page has not changed since the last fetch. The new crawl state is only
+    staged; main() flushes it for the pages whose content was saved.
+    """
     try:
-        response = requests.get(url)
+        state = crawl_state.get(url) if crawl_state else None
+        headers = crawl_state.conditional_headers(state) if crawl_state else None
+        response = requests.get(url, headers=headers)
+        if crawl_state and response.status_code == 304:
+            crawl_state.mark_not_modified()
+            return None
         response.raise_for_status()  # Raise an exception for bad status codes
+        if crawl_state:
+            changed = crawl_state.record(url, state, response, response.content)
+            if not changed:
+                return None
         return response.text
     except requests.RequestException as e:
         print(f"Error fetching {url}: {e}")
@@ -24,22 +39,25 @@ def extract_body_content(html_content):
     return ""
 
 def save_content_as_text(content, filename):
-    """Save content as a text file."""
+    """Save content as a text file; return True if it was written."""
     try:
         with open(filename, 'w', encoding='utf-8') as file:
             file.write(content)
         print(f"Content saved successfully: {filename}")
+        return True
     except Exception as e:
         print(f"Error saving content: {e}")
+        return False
 
-def process_url(url, output_dir):
-    """Process a single URL: fetch, extract, and save content."""
-    html_content = fetch_html(url)
+def process_url(url, output_dir, crawl_state=None):
+    """Process a single URL: fetch, extract, and save content; return True if it was saved."""
+    html_content = fetch_html(url, crawl_state)
     if html_content:
         body_content = extract_body_content(html_content)
         safe_filename = "".join([c for c in url if c.isalpha() or c.isdigit() or c==' ']).rstrip()
         output_file = os.path.join(output_dir, f"{safe_filename}.txt")
-        save_content_as_text(body_content, output_file)
+        return save_content_as_text(body_content, output_file)
+    return False
 
 def main():
     urls = [
@@ -50,11 +68,17 @@ def main():
     
     output_dir = "extracted_content"
     os.makedirs(output_dir, exist_ok=True)
+    crawl_state = CrawlState()
+    saved_urls = []
     
     for i, url in enumerate(urls, 1):
         print(f"Processing file: {i}")
-        process_url(url, output_dir)
+        if process_url(url, output_dir, crawl_state):
+            saved_urls.append(url)
         print(f"File {i} processed")
+    # Pages that failed to save keep their old state and are fetched again next run.
+    crawl_state.flush(saved_urls)
+    crawl_state.report()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,9 @@
+import asyncio
 import requests
 from bs4 import BeautifulSoup
+from crawl_state import CrawlState
+from sitemap_crawler import SitemapCrawler
+from url_store import UrlStore
 
 def parse_sitemap(url):
     response = requests.get(url)
@@ -32,12 +36,15 @@ def save_urls_to_file(urls, filename):
 
 if __name__ == "__main__":
     sitemap_url = "https://www.swinburne.edu.au/sitemap.xml"
-    all_urls = parse_sitemap(sitemap_url)
     sitemap_url2 = 'https://www.swinburneonline.edu.au/sitemap_index.xml'
-    all_urls.extend(parse_sitemap(sitemap_url2))
+    crawler = SitemapCrawler()
+    all_urls = asyncio.run(crawler.crawl([sitemap_url, sitemap_url2]))
+    # Re-crawls compare these against the lastmod seen at each page's last fetch.
+    CrawlState().set_sitemap_lastmod(crawler.lastmod)
 
 
-    save_urls_to_file(all_urls, 'urls_list.py')
+    added = UrlStore().append(all_urls)
+    print(f"{len(all_urls)} urls found, {added} new")
     
     #for url in all_urls:
         #print(url)
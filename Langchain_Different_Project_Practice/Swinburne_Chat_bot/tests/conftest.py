@@ -0,0 +1,72 @@
+import functools
+import os
+import re
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The bot's modules are flat scripts that import each other by name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import create_vector_store
+
+class SiteHandler(SimpleHTTPRequestHandler):
+    """Serves the site directory with Last-Modified / If-Modified-Since; /error<code>/... fails with that status."""
+
+    def do_GET(self):
+        if match := re.match(r"/error(\d{3})/", self.path):
+            self.send_error(int(match.group(1)))
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+class Site:
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+    def write(self, name, text, mtime=None):
+        path = os.path.join(self.root, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(f"<html><head><title>{name}</title></head><body><p>{text}</p></body></html>")
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return self.url(name)
+
+    def remove(self, name):
+        os.remove(os.path.join(self.root, name))
+
+@pytest.fixture
+def site(tmp_path):
+    """A local web server over a temporary directory that tests can edit between requests."""
+    root = tmp_path / "site"
+    root.mkdir()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(SiteHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield Site(str(root), f"http://127.0.0.1:{server.server_address[1]}")
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def build_args(tmp_path, monkeypatch):
+    """create_vector_store.py arguments for an offline build under tmp_path; extra flags are appended."""
+    def make(*extra):
+        monkeypatch.setattr(sys, 'argv', [
+            'create_vector_store.py',
+            '--output', str(tmp_path / "index"),
+            '--fake-embeddings', '16',
+            '--embedding-cache', str(tmp_path / "embedding_cache.sqlite"),
+            '--crawl-state', str(tmp_path / "crawl_state.sqlite"),
+            '--fetch-workers', '2',
+            *extra,
+        ])
+        return create_vector_store.parse_args()
+    return make
@@ -0,0 +1,78 @@
+import pytest
+
+from create_vector_store import build_index
+from crawl_state import CrawlState
+from index_manifest import SourceManifest
+from ingest_pipeline import IngestionFailed
+
+# A fixed modification time, so a page put back later is served with the same Last-Modified.
+MTIME = 1_700_000_000
+
+def write_pages(site, count=3):
+    return [site.write(f"p{i}.html", f"Swinburne page {i} about courses, units and campus {i}.", MTIME)
+            for i in range(count)]
+
+def ids(index_dir):
+    return {url: entry['ids'] for url, entry in SourceManifest.load(index_dir).entries.items()}
+
+def test_build_indexes_every_page(site, build_args):
+    urls = write_pages(site)
+    args = build_args()
+    assert build_index(args, urls, args.output) == 3
+    assert set(ids(args.output)) == set(urls)
+
+def test_update_skips_unchanged_pages_and_reembeds_changed_ones(site, build_args):
+    urls = write_pages(site)
+    args = build_args()
+    build_index(args, urls, args.output)
+    before = ids(args.output)
+
+    site.write("p1.html", "Swinburne page 1 now lists new units.", MTIME + 100)
+    args = build_args('--update')
+    assert build_index(args, urls, args.output) == 3
+    after = ids(args.output)
+    assert after[urls[0]] == before[urls[0]]
+    assert after[urls[2]] == before[urls[2]]
+    assert after[urls[1]] != before[urls[1]]
+
+def test_page_that_returns_after_404_is_indexed_again(site, build_args, tmp_path):
+    urls = write_pages(site)
+    args = build_args()
+    build_index(args, urls, args.output)
+
+    site.remove("p1.html")
+    args = build_args('--update')
+    build_index(args, urls, args.output)
+    assert urls[1] not in ids(args.output)
+    assert CrawlState(str(tmp_path / "crawl_state.sqlite")).get(urls[1]) is None
+
+    # Same body and Last-Modified as before it vanished: a conditional GET would get a 304.
+    write_pages(site)
+    build_index(args, urls, args.output)
+    assert set(ids(args.output)) == set(urls)
+
+def test_permanent_fetch_errors_are_skipped_not_failed(site, build_args):
+    urls = write_pages(site) + [site.url("missing.html")]
+    args = build_args()
+    assert build_index(args, urls, args.output) == 3
+    assert set(ids(args.output)) == set(urls[:3])
+
+def test_transient_fetch_errors_fail_the_build_after_saving(site, build_args):
+    urls = write_pages(site) + [site.url("error503/p.html")]
+    args = build_args()
+    with pytest.raises(IngestionFailed) as failed:
+        build_index(args, urls, args.output)
+    assert failed.value.failures == {'fetch': 1}
+    assert set(ids(args.output)) == set(urls[:3])
+
+def test_update_fetches_pages_new_to_this_index_despite_shared_crawl_state(site, build_args, tmp_path):
+    urls = write_pages(site)
+    args = build_args()
+    build_index(args, urls, args.output)
+
+    # A second index sharing the crawl state has seen p1 only through the first one.
+    other = build_args('--output', str(tmp_path / "other"))
+    build_index(other, urls[:1], other.output)
+    other = build_args('--output', str(tmp_path / "other"), '--update')
+    build_index(other, urls[:2], other.output)
+    assert set(ids(other.output)) == set(urls[:2])
@@ -0,0 +1,85 @@
+import asyncio
+import itertools
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from create_vector_store import build_index
+from http_api import MAX_K, create_app
+
+class FailingChatModel(GenericFakeChatModel):
+    def _generate(self, *args, **kwargs):
+        raise RuntimeError("model unavailable")
+
+    def _stream(self, *args, **kwargs):
+        raise RuntimeError("model unavailable")
+
+def fake_llm():
+    return GenericFakeChatModel(messages=(AIMessage(content=f"answer {i}") for i in itertools.count()))
+
+@pytest.fixture
+def index(site, build_args):
+    urls = [site.write(f"p{i}.html", f"Swinburne page {i} about enrolment and fees {i}.") for i in range(4)]
+    args = build_args()
+    build_index(args, urls, args.output)
+    return args.output
+
+def call(index_path, requests, llm=None, **options):
+    """Send (method, path, json) requests to a fresh app; return (status, body) for each."""
+    async def run():
+        app = create_app(index_path, embedder=DeterministicFakeEmbedding(size=16), llm=llm or fake_llm(), **options)
+        async with TestClient(TestServer(app)) as client:
+            results = []
+            for method, path, body in requests:
+                response = await client.request(method, path, json=body)
+                is_json = response.content_type == 'application/json'
+                results.append((response.status, await response.json() if is_json else await response.text()))
+            return results
+    return asyncio.run(run())
+
+def test_health_and_chat(index, tmp_path):
+    (health, body), (status, chat) = call(index, [
+        ('GET', '/health', None),
+        ('POST', '/chat', {'query': 'What are the fees?', 'session_id': 's1'}),
+    ], usage_path=str(tmp_path / "usage.sqlite"))
+    assert health == 200 and body['vectors'] == 4
+    assert status == 200
+    assert chat['answer'] == "answer 0"
+    assert chat['usage']['prompt_tokens'] > 0
+
+@pytest.mark.parametrize('body', [
+    {},
+    {'query': ''},
+    {'query': 3},
+    {'query': 'fees', 'session_id': 7},
+    {'query': 'fees', 'history': 'hi'},
+    [1, 2],
+])
+def test_chat_rejects_bad_requests(index, body):
+    [(status, _)] = call(index, [('POST', '/chat', body)])
+    assert status == 400
+
+@pytest.mark.parametrize('k', [0, MAX_K + 1, True, "4"])
+def test_retrieve_rejects_bad_k(index, k):
+    [(status, _)] = call(index, [('POST', '/retrieve', {'query': 'fees', 'k': k})])
+    assert status == 400
+
+def test_retrieve(index):
+    [(status, body)] = call(index, [('POST', '/retrieve', {'query': 'enrolment', 'k': 2})])
+    assert status == 200
+    assert len(body['documents']) == 2
+
+def test_chat_stream_sends_tokens_then_done(index):
+    [(status, text)] = call(index, [('POST', '/chat/stream', {'query': 'What are the fees?'})])
+    assert status == 200
+    assert 'event: token' in text
+    assert text.rstrip().split("\n\n")[-1] == 'event: done\ndata: {"answer": "answer 0"}'
+
+def test_chat_stream_reports_errors_as_an_event(index):
+    [(status, text)] = call(index, [('POST', '/chat/stream', {'query': 'What are the fees?'})],
+                            llm=FailingChatModel(messages=iter([])))
+    assert status == 200
+    assert text.rstrip().endswith('event: error\ndata: {"error": "the answer could not be generated"}')
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from create_vector_store import build_index, build_search_indexes, get_embedder
+from index_manifest import SourceManifest
+from ingest_pipeline import IngestionFailed
+from sharded_build import DONE_FILE, run_sharded_build, split_shards
+
+def test_split_shards_covers_every_item():
+    assert split_shards(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert split_shards(2, 5) == [(0, 1), (1, 2)]
+
+def build(urls, args):
+    run_sharded_build(urls, args, build_index, build_search_indexes, get_embedder(args.fake_embeddings))
+
+def test_shards_are_merged_into_one_index(site, build_args):
+    urls = [site.write(f"p{i}.html", f"Swinburne page {i} about enrolment {i}.") for i in range(6)]
+    args = build_args('--shards', '3', '--jobs', '2')
+    build(urls, args)
+    assert set(SourceManifest.load(args.output).entries) == set(urls)
+    assert os.path.exists(os.path.join(args.output, "lexical.sqlite"))
+    assert not os.path.exists(f"{args.output}-shards")
+
+def test_a_permanently_broken_url_does_not_block_the_merge(site, build_args):
+    urls = [site.write(f"p{i}.html", f"Swinburne page {i} about enrolment {i}.") for i in range(5)]
+    broken = [site.url("missing.html"), site.url("error403/private.html"), "not a url"]
+    urls[1:1] = broken
+    args = build_args('--shards', '3', '--jobs', '2')
+    build(urls, args)
+    assert set(SourceManifest.load(args.output).entries) == set(urls) - set(broken)
+
+def test_a_transient_failure_leaves_its_shard_unfinished(site, build_args):
+    urls = [site.write(f"p{i}.html", f"Swinburne page {i} about enrolment {i}.") for i in range(5)]
+    urls.append(site.url("error503/p.html"))
+    args = build_args('--shards', '2', '--jobs', '2')
+    with pytest.raises(IngestionFailed):
+        build(urls, args)
+    assert not os.path.exists(args.output)
+    work_dir = f"{args.output}-shards"
+    done = {name: os.path.exists(os.path.join(work_dir, name, DONE_FILE)) for name in os.listdir(work_dir)}
+    assert done == {'shard-0-3': True, 'shard-3-6': False}
@@ -0,0 +1,22 @@
+from crawl_state import CrawlState
+from swinburne_url_pdf import fetch_html, process_url
+
+def test_crawl_state_is_only_kept_for_saved_pages(site, tmp_path):
+    url = site.write("p.html", "Swinburne library opening hours.")
+    crawl_state = CrawlState(str(tmp_path / "crawl_state.sqlite"))
+    output_dir = tmp_path / "extracted"
+    output_dir.mkdir()
+
+    # Saving fails (no such directory), so the page must be fetched again next time.
+    assert not process_url(url, str(tmp_path / "missing"), crawl_state)
+    crawl_state.flush([])
+    assert crawl_state.get(url) is None
+
+    assert process_url(url, str(output_dir), crawl_state)
+    crawl_state.flush([url])
+    assert crawl_state.get(url)['last_modified']
+    assert len(list(output_dir.iterdir())) == 1
+
+    # The flushed Last-Modified makes the next fetch a conditional one.
+    assert fetch_html(url, crawl_state) is None
+    assert crawl_state.not_modified == 1
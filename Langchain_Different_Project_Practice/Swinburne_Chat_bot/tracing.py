@@ -0,0 +1,255 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# The innermost open span in this context; langchain copies contexts into the
+# threads it runs chain steps on, so spans opened there find their parent.
+_current_span = contextvars.ContextVar('current_span', default=None)
+_exporter = None
+_exporter_spec = None
+
+class Span:
+    """One timed stage. Use as a context manager, or start() and end() it by hand."""
+
+    def __init__(self, name, attributes, parent=None):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_time = time.time()
+        self.duration_ms = None
+        self._start = time.perf_counter()
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def start(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def end(self, error=None):
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if error is not None:
+            self.attributes['error'] = f"{type(error).__name__}: {error}"
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended from another context, e.g. a generator closed by the garbage collector.
+                pass
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+    def to_dict(self):
+        return {'name': self.name, 'trace_id': self.trace_id, 'span_id': self.span_id,
+                'parent_id': self.parent_id, 'start_time': self.start_time,
+                'duration_ms': self.duration_ms, 'attributes': self.attributes}
+
+class _NullSpan:
+    """What span() hands out while tracing is off: every call is a no-op."""
+
+    def set(self, **attributes):
+        pass
+
+    def start(self):
+        return self
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+def tracing_enabled():
+    return _exporter is not None
+
+def span(name, **attributes):
+    """A span for stage name, a child of the span open in this context.
+
+    With tracing off this returns a shared no-op span without timing anything.
+    """
+    if _exporter is None:
+        return NULL_SPAN
+    return Span(name, attributes, _current_span.get())
+
+class LogExporter:
+    def export(self, span):
+        attributes = ' '.join(f"{key}={value}" for key, value in span.attributes.items())
+        print(f"[trace {span.trace_id[:8]}] {span.name} {span.duration_ms:.1f} ms {attributes}".rstrip())
+
+class JsonFileExporter:
+    """Appends one JSON object per finished span to path."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class InMemoryExporter:
+    """Keeps finished spans in a list, for tests and benchmarks."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def names(self):
+        return [span.name for span in self.spans]
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+def configure_tracing(exporter):
+    """Send finished spans to exporter; None turns tracing off."""
+    global _exporter, _exporter_spec
+    _exporter = exporter
+    _exporter_spec = None
+    return exporter
+
+def configure_tracing_from_env():
+    """TRACE_EXPORTER=log, memory or json (to TRACE_FILE, default traces.jsonl); unset turns tracing off.
+
+    Calling it again with the same settings keeps the current exporter, so
+    Streamlit reruns don't reopen the trace file.
+    """
+    global _exporter_spec
+    spec = (os.getenv('TRACE_EXPORTER', '').lower(), os.getenv('TRACE_FILE', 'traces.jsonl'))
+    if spec == _exporter_spec:
+        return _exporter
+    kind, path = spec
+    if kind in ('', 'off', 'none'):
+        exporter = None
+    elif kind == 'log':
+        exporter = LogExporter()
+    elif kind == 'memory':
+        exporter = InMemoryExporter()
+    elif kind == 'json':
+        exporter = JsonFileExporter(path)
+    else:
+        raise ValueError(f"unknown TRACE_EXPORTER {kind!r}; expected log, json or memory")
+    configure_tracing(exporter)
+    _exporter_spec = spec
+    return exporter
+
+class TracedIndex:
+    """Times search() on a faiss index (or RerankedIndex); everything else passes through."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def search(self, queries, k):
+        with span('faiss.search', k=k, queries=len(queries)):
+            return self.index.search(queries, k)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Turns the retrieval chain's retriever, prompt and LLM runs into spans.
+
+    Pass one per request in the chain's config; it is only needed while tracing is on.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._spans = {}
+        # Start times of LLM runs still waiting for their first streamed token.
+        self._awaiting_token = {}
+
+    def _start(self, run_id, name, current=False, **attributes):
+        # Only the retriever run is made current, so the embedding and FAISS spans
+        # nest under it: its start and end always fire in the same context,
+        # unlike streamed chain steps.
+        new_span = span(name, **attributes)
+        self._spans[run_id] = new_span.start() if current else new_span
+
+    def _end(self, run_id, error=None, **attributes):
+        current = self._spans.pop(run_id, None)
+        if current is not None:
+            current.set(**attributes)
+            current.end(error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id, 'retrieve', current=True)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        # create_stuff_documents_chain formats the documents in a step named
+        # format_inputs, then fills the prompt template.
+        if kwargs.get('name') == 'format_inputs':
+            self._start(run_id, 'prompt.documents')
+        elif kwargs.get('run_type') == 'prompt':
+            self._start(run_id, 'prompt.template')
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def _llm_start(self, serialized, run_id, kwargs):
+        params = kwargs.get('invocation_params') or {}
+        self._start(run_id, 'llm', model=params.get('model_name') or params.get('model'))
+        self._awaiting_token[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._llm_start(serialized, run_id, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._llm_start(serialized, run_id, kwargs)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if token and run_id in self._awaiting_token:
+            start = self._awaiting_token.pop(run_id)
+            self._spans[run_id].set(ttft_ms=round((time.perf_counter() - start) * 1000, 1))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._awaiting_token.pop(run_id, None)
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        self._end(run_id, **{key: usage[key] for key in ('prompt_tokens', 'completion_tokens') if key in usage})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._awaiting_token.pop(run_id, None)
+        self._end(run_id, error)
@@ -0,0 +1,103 @@
+import argparse
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATH = 'urls.sqlite'
+
+class UrlStore:
+    """Append-only SQLite store of crawl URLs.
+
+    URLs keep the position they were added at, so slice(start, end) gives
+    stable shards; host/path-prefix queries use the (host, path) index.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE, "
+            "host TEXT NOT NULL, path TEXT NOT NULL, added_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS urls_host_path ON urls (host, path)")
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def __iter__(self):
+        return self._stream("SELECT url FROM urls ORDER BY id", ())
+
+    def _stream(self, query, params, batch_size=1000):
+        cursor = self._conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
+
+    def append(self, urls):
+        """Add urls not already stored; returns how many were new."""
+        now = time.time()
+        rows = []
+        for url in urls:
+            parts = urlsplit(url)
+            rows.append((url, parts.netloc, parts.path or '/', now))
+        before = self._conn.total_changes
+        self._conn.executemany("INSERT OR IGNORE INTO urls (url, host, path, added_at) VALUES (?, ?, ?, ?)", rows)
+        self._conn.commit()
+        return self._conn.total_changes - before
+
+    def slice(self, start=0, end=None):
+        """URLs at positions [start, end) in insertion order."""
+        limit = -1 if end is None else max(end - start, 0)
+        return list(self._stream("SELECT url FROM urls ORDER BY id LIMIT ? OFFSET ?", (limit, start)))
+
+    def filter(self, host=None, path_prefix=None):
+        """Stream URLs on host (any host if None) whose path starts with path_prefix."""
+        clauses = []
+        params = []
+        if host is not None:
+            clauses.append("host = ?")
+            params.append(host)
+        if path_prefix:
+            # A range rather than LIKE so the (host, path) index is used.
+            clauses.append("path >= ? AND path < ?")
+            params.extend([path_prefix, path_prefix + '\U0010ffff'])
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        return self._stream(f"SELECT url FROM urls {where}ORDER BY id", params)
+
+    def close(self):
+        self._conn.close()
+
+def migrate_from_urls_list(path=DEFAULT_PATH):
+    """Load the generated urls_list.py into the store, keeping its order."""
+    from urls_list import urls
+
+    store = UrlStore(path)
+    added = store.append(urls)
+    print(f"Migrated {added} of {len(urls)} urls from urls_list.py into {path} ({len(store)} total)")
+    store.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the crawl URL store.")
+    parser.add_argument('--store', default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help="import urls_list.urls")
+    add_parser = commands.add_parser('add', help="append URLs from a newline-separated file")
+    add_parser.add_argument('file')
+    list_parser = commands.add_parser('list', help="print stored URLs")
+    list_parser.add_argument('--host')
+    list_parser.add_argument('--path-prefix')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate_from_urls_list(args.store)
+    elif args.command == 'add':
+        with open(args.file) as file:
+            print(f"Added {UrlStore(args.store).append(line.strip() for line in file if line.strip())} urls")
+    else:
+        for url in UrlStore(args.store).filter(args.host, args.path_prefix):
+            print(url)
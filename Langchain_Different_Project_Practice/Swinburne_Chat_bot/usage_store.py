@@ -0,0 +1,177 @@
+import argparse
+import sqlite3
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# USD per million (prompt, completion) tokens. Dated model names such as
+# gpt-4o-2024-08-06 are priced by their longest matching prefix.
+PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+}
+
+# Parts of the prompt each call's prompt tokens are attributed to.
+PROMPT_PARTS = ('system', 'history', 'context', 'input')
+
+def price(model):
+    matches = [name for name in PRICES if (model or '').startswith(name)]
+    return PRICES[max(matches, key=len)] if matches else None
+
+def cost(model, prompt_tokens, completion_tokens):
+    """USD for one call, or None for a model missing from PRICES."""
+    rates = price(model)
+    if rates is None:
+        return None
+    return (prompt_tokens * rates[0] + completion_tokens * rates[1]) / 1e6
+
+class UsageStore:
+    """SQLite log of the tokens and cost of every model call, one row per call.
+
+    Prompt tokens are also split by prompt part (system prompt, history,
+    retrieved context, user input), as estimated with the local tokenizer;
+    prompt_tokens itself is the count the API reported, or the estimate
+    (estimated = 1) when the response carried no usage.
+    """
+
+    def __init__(self, path='usage.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "id INTEGER PRIMARY KEY, created_at REAL NOT NULL, session_id TEXT, source TEXT NOT NULL, "
+            "model TEXT, prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+            "system_tokens INTEGER, history_tokens INTEGER, context_tokens INTEGER, input_tokens INTEGER, "
+            "estimated INTEGER NOT NULL DEFAULT 0, cached INTEGER NOT NULL DEFAULT 0, "
+            "latency_ms REAL, cost REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS usage_session ON usage (session_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS usage_created_at ON usage (created_at)")
+        self._conn.commit()
+
+    def record(self, session_id, model, prompt_tokens, completion_tokens, parts=None, source='chat',
+               estimated=False, cached=False, latency_ms=None):
+        """Store one call and return its cost."""
+        parts = parts or {}
+        call_cost = cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO usage (created_at, session_id, source, model, prompt_tokens, completion_tokens, "
+                "system_tokens, history_tokens, context_tokens, input_tokens, estimated, cached, latency_ms, cost) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), session_id, source, model, prompt_tokens, completion_tokens,
+                 *(parts.get(part) for part in PROMPT_PARTS), int(estimated), int(cached), latency_ms, call_cost)
+            )
+            self._conn.commit()
+        return call_cost
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def session_totals(self, session_id):
+        return self.query(
+            "SELECT COUNT(*) AS calls, COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens, "
+            "COALESCE(SUM(completion_tokens), 0) AS completion_tokens, COALESCE(SUM(cost), 0) AS cost "
+            "FROM usage WHERE session_id = ?", (session_id,)
+        )[0]
+
+    def by_session(self, limit=20, since=0):
+        """The sessions that cost the most."""
+        return self.query(
+            "SELECT session_id, COUNT(*) AS calls, SUM(cached) AS cached, SUM(prompt_tokens) AS prompt_tokens, "
+            "SUM(completion_tokens) AS completion_tokens, ROUND(SUM(cost), 6) AS cost, "
+            "datetime(MIN(created_at), 'unixepoch') AS started_at, datetime(MAX(created_at), 'unixepoch') AS last_at "
+            "FROM usage WHERE created_at >= ? GROUP BY session_id ORDER BY SUM(cost) DESC, prompt_tokens DESC LIMIT ?",
+            (since, limit)
+        )
+
+    def by_model(self, since=0):
+        return self.query(
+            "SELECT model, source, COUNT(*) AS calls, SUM(prompt_tokens) AS prompt_tokens, "
+            "SUM(completion_tokens) AS completion_tokens, ROUND(SUM(cost), 6) AS cost, "
+            "ROUND(AVG(latency_ms), 1) AS avg_latency_ms "
+            "FROM usage WHERE created_at >= ? AND cached = 0 GROUP BY model, source ORDER BY SUM(cost) DESC",
+            (since,)
+        )
+
+    def by_part(self, since=0):
+        """Prompt tokens per prompt part, summed over every uncached call."""
+        sums = ', '.join(f"SUM({part}_tokens) AS {part}" for part in PROMPT_PARTS)
+        return self.query(f"SELECT {sums}, SUM(prompt_tokens) AS prompt_tokens FROM usage "
+                          f"WHERE created_at >= ? AND cached = 0", (since,))[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Collects the token usage the model reports for the calls of one request."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.model = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.reported = False
+
+    def on_llm_end(self, response, **kwargs):
+        llm_output = response.llm_output or {}
+        self.model = llm_output.get('model_name') or self.model
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, 'message', None)
+                usage = getattr(message, 'usage_metadata', None) or usage
+                self.model = (getattr(message, 'response_metadata', None) or {}).get('model_name') or self.model
+        if usage:
+            self.prompt_tokens += usage['input_tokens']
+            self.completion_tokens += usage['output_tokens']
+            self.reported = True
+        elif llm_output.get('token_usage'):
+            self.prompt_tokens += llm_output['token_usage'].get('prompt_tokens', 0)
+            self.completion_tokens += llm_output['token_usage'].get('completion_tokens', 0)
+            self.reported = True
+
+def print_rows(rows):
+    if not rows:
+        print("(no usage recorded)")
+        return
+    columns = list(rows[0])
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report token usage and cost from a usage store.")
+    parser.add_argument('report', nargs='?', default='sessions', choices=('sessions', 'models', 'parts', 'session'))
+    parser.add_argument('session_id', nargs='?')
+    parser.add_argument('--db', default='usage.sqlite')
+    parser.add_argument('--days', type=float, help="only calls from the last DAYS days")
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    store = UsageStore(args.db)
+    since = time.time() - args.days * 86400 if args.days else 0
+    if args.report == 'sessions':
+        print_rows(store.by_session(args.limit, since))
+    elif args.report == 'models':
+        print_rows(store.by_model(since))
+    elif args.report == 'parts':
+        print_rows([store.by_part(since)])
+    else:
+        if not args.session_id:
+            parser.error("session needs a session_id")
+        print_rows(store.query(
+            "SELECT datetime(created_at, 'unixepoch') AS at, source, model, prompt_tokens, completion_tokens, "
+            "system_tokens, history_tokens, context_tokens, input_tokens, cached, estimated, ROUND(latency_ms, 1) AS latency_ms, cost "
+            "FROM usage WHERE session_id = ? ORDER BY created_at", (args.session_id,)
+        ))